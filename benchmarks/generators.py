@@ -0,0 +1,112 @@
+"""Synthetic inputs shaped like what the api gets from Covalent and from clients
+
+Everything is built from a seeded Random, so a size always gives the same data.
+"""
+import base64
+import json
+import random
+
+from typing import Any, Dict, List
+
+from src.database.Model import Vault
+
+SEED = 1337
+
+def _address(rng: random.Random) -> str:
+    return '0x' + ''.join(rng.choice('0123456789abcdef') for _ in range(40))
+
+def _token_url(rng: random.Random) -> str:
+    """A token url like the ones seen in balances_v2, inline ones included"""
+    kind = rng.random()
+    if kind < 0.15:
+        image = base64.b64encode(rng.randbytes(rng.randint(200, 4000))).decode()
+        return f'data:image/png;base64,{image}'
+    if kind < 0.35:
+        metadata = json.dumps({'name': f'Token {rng.randint(0, 10000)}', 'image': f'ipfs://Qm{rng.randbytes(22).hex()}'})
+        return 'data:application/json;base64,' + base64.b64encode(metadata.encode()).decode()
+    if kind < 0.4:
+        return 'data:application/json,{not json'
+    return f'https://metadata.example.com/token/{rng.randint(0, 10 ** 6)}'
+
+def _nft_data(rng: random.Random) -> Dict[str, Any]:
+    nft_data: Dict[str, Any] = {'token_id': str(rng.randint(0, 10 ** 6))}
+    if rng.random() < 0.95:
+        nft_data['token_url'] = _token_url(rng)
+    if rng.random() < 0.6:
+        nft_data['external_data'] = {
+            'name': f'Token {nft_data["token_id"]}',
+            'image': f'https://images.example.com/{nft_data["token_id"]}.png',
+        }
+    return nft_data
+
+def balances_v2_items(size: int, seed: int = SEED) -> List[Dict[str, Any]]:
+    """``size`` balances_v2 items: contracts with one to a few nfts, some empty or with missing fields"""
+    rng = random.Random(seed)
+    items = []
+    for _ in range(size):
+        item: Dict[str, Any] = {
+            'contract_address': _address(rng),
+            'contract_name': f'Collection {rng.randint(0, 1000)}',
+            'contract_ticker_symbol': 'NFT',
+            'balance': str(rng.choice([0, 1, 1, 1, 2, 3])),
+            'type': 'nft',
+        }
+        if rng.random() < 0.05:
+            del item['contract_name']
+        if rng.random() < 0.97:
+            item['nft_data'] = [_nft_data(rng) for _ in range(rng.randint(1, 3))]
+        items.append(item)
+    return items
+
+def nfts(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [{
+        'address': _address(rng),
+        'name': f'Token {i}',
+        'symbol': 'NFT',
+        'tokenId': str(rng.randint(0, 10 ** 6)),
+        'image': f'https://images.example.com/{i}.png',
+    } for i in range(size)]
+
+def vault_rows(size: int, seed: int = SEED) -> List[Vault]:
+    """``size`` Vault rows as they come out of the database, not attached to a session"""
+    rng = random.Random(seed)
+    return [Vault(
+        name=f'Vault {i}',
+        symbol=f'V{i}',
+        supply=str(rng.randint(1, 10 ** 24)),
+        price=str(rng.randint(1, 10 ** 18)),
+        fee=str(rng.randint(0, 100)),
+        contract_address=_address(rng),
+        curator_address=_address(rng),
+        description='',
+        verified=rng.randint(0, 1),
+        nfts=json.dumps(nfts(rng.randint(1, 10), rng)),
+        chainId=43114,
+    ) for i in range(size)]
+
+def post_vault_payloads(size: int, seed: int = SEED, max_nfts: int = 10) -> List[Dict[str, Any]]:
+    """``size`` bodies of a vault POST, with one to ``max_nfts`` nfts each"""
+    rng = random.Random(seed)
+    return [{
+        'chainID': '43114',
+        'name': f'Vault {i}',
+        'symbol': f'V{i}',
+        'supply': str(rng.randint(1, 10 ** 24)),
+        'price': str(rng.randint(1, 10 ** 18)),
+        'fee': str(rng.randint(0, 100)),
+        'contract_address': _address(rng),
+        'curator_address': _address(rng),
+        'nfts': nfts(rng.randint(1, max_nfts), rng),
+    } for i in range(size)]
+
+def nfts_user_args(size: int, seed: int = SEED) -> List[Dict[str, Any]]:
+    """``size`` getNftsUser arguments, lowercase addresses as most clients send them"""
+    rng = random.Random(seed)
+    return [{'address': _address(rng), 'chainID': rng.choice(['43113', '43114'])} for _ in range(size)]
+
+def vaults_by_address_args(size: int, seed: int = SEED) -> Dict[str, Any]:
+    """A vaultsByAddress body with ``size`` addresses, a third of them repeated"""
+    rng = random.Random(seed)
+    addresses = [_address(rng) for _ in range(size - size // 3)]
+    addresses += rng.choices(addresses, k=size // 3)
+    return {'chainID': '43114', 'addresses': addresses}
@@ -0,0 +1,101 @@
+"""Time spent on the request path by log calls, with and without the log writer
+
+Run from the repository root:
+
+    python -m benchmarks.logging_overhead [--calls 20000]
+
+``sync`` is how logging worked before: a FileHandler on the root logger and
+messages built with f-strings at the call. ``queued`` is the current setup:
+the records go to the LogWriter queue and are formatted and written by its
+thread. Only the time in the calling thread is measured, which is what a
+request waits on; ``drain`` is the time the writer needs afterwards.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from src.logging import LogsAdapter, log_writer
+
+VAULT = {
+    'name': 'Fractional vault',
+    'symbol': 'FRV',
+    'supply': '1000000000000000000000',
+    'price': '1000000000000000',
+    'fee': '25',
+    'contract_address': '0x' + 'ab' * 20,
+    'curator_address': '0x' + 'cd' * 20,
+    'nfts': [{'address': '0x' + 'ef' * 20, 'tokenId': str(i)} for i in range(50)],
+}
+# an upstream error page, logged as is before
+RESPONSE_TEXT = '<html>' + 'x' * 50000 + '</html>'
+
+def _file_handler(path: str) -> logging.FileHandler:
+    handler = logging.FileHandler(filename=path, encoding='utf-8', mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+    return handler
+
+def _log_sync(logger: logging.Logger, i: int) -> None:
+    logger.debug("Insert new vault: " + str(VAULT))
+    if i % 10 == 0:
+        logger.warning(
+            f'Covalent API request https://api.covalenthq.com/v1/43114/address failed '
+            f'with HTTP status code 502 and text {RESPONSE_TEXT}'
+        )
+
+def _log_queued(log: LogsAdapter, i: int) -> None:
+    log.debug('Insert new vault', chain='43114', vault=VAULT)
+    if i % 10 == 0:
+        log.warning('Covalent API request failed', module='balances_v2', status_code=502, text=RESPONSE_TEXT)
+
+def bench_sync(path: str, calls: int) -> float:
+    logger = logging.getLogger('bench.sync')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = _file_handler(path)
+    logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(calls):
+        _log_sync(logger, i)
+    elapsed = time.perf_counter() - start
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+def bench_queued(path: str, calls: int) -> tuple:
+    logger = logging.getLogger('bench.queued')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = _file_handler(path)
+    log_writer.start([handler])
+    logger.addHandler(log_writer.handler)
+    log = LogsAdapter(logger)
+    start = time.perf_counter()
+    for i in range(calls):
+        _log_queued(log, i)
+    elapsed = time.perf_counter() - start
+    log_writer.stop(timeout=600)
+    drain = time.perf_counter() - start - elapsed
+    logger.removeHandler(log_writer.handler)
+    handler.close()
+    return elapsed, drain
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync = bench_sync(os.path.join(directory, 'sync.log'), args.calls)
+        queued, drain = bench_queued(os.path.join(directory, 'queued.log'), args.calls)
+
+    print(f'sync:   {sync / args.calls * 1e6:8.2f} us/call on the request path')
+    print(f'queued: {queued / args.calls * 1e6:8.2f} us/call on the request path (drain {drain:.2f}s)')
+    print(f'speedup: {sync / queued:.1f}x')
+
+if __name__ == '__main__':
+    main()
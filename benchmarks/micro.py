@@ -0,0 +1,192 @@
+"""Micro-benchmarks of the request hot paths on synthetic data
+
+Run from the repository root:
+
+    python -m benchmarks.micro [--sizes 10 100 1000] [--filter NAME]
+                               [--output results.json]
+                               [--save-baseline baseline.json | --baseline baseline.json]
+
+Each benchmark runs at every size: the number of balances_v2 items, vault
+rows or request payloads it gets. The time reported is per call, the median
+of ``--rounds`` rounds. With ``--baseline`` every result is compared with the
+saved one and the exit status is 1 when any got slower than ``--threshold``.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.api.app import create_app
+from src.api.rest import JSON_ENCODERS, api_response, set_json_encoder
+from src.api.v1.encoding import GetVaultsByAddressSchema, NFTsUserSchema, PostVaultSchema
+from src.api_functions import Api_functions
+from src.database.vault_index import VaultRecord
+
+from benchmarks import generators
+
+DEFAULT_SIZES = (10, 100, 1000)
+# A round runs the benchmark as many times as fit in this many seconds
+ROUND_TIME = 0.1
+
+def bench_normalize_nfts(size: int) -> Callable[[], Any]:
+    items = generators.balances_v2_items(size)
+    return lambda: list(Api_functions._normalize_nfts(items))  # pylint: disable=protected-access
+
+def bench_vault_deserialize(size: int) -> Callable[[], Any]:
+    rows = generators.vault_rows(size)
+    return lambda: [row.deserialize() for row in rows]
+
+def bench_vault_record_deserialize(size: int) -> Callable[[], Any]:
+    """Like vault_deserialize, from the records of the vault index"""
+    records = [VaultRecord(row) for row in generators.vault_rows(size)]
+    return lambda: [record.deserialize() for record in records]
+
+def _bench_api_response(encoder: str) -> Callable[[int], Callable[[], Any]]:
+    def setup(size: int) -> Callable[[], Any]:
+        items = list(Api_functions._normalize_nfts(generators.balances_v2_items(size)))  # pylint: disable=protected-access  # noqa: E501
+        result = {'result': {'address': '0x' + '00' * 20, 'chainID': 43114, 'items': items}, 'message': ''}
+
+        def run() -> Any:
+            set_json_encoder(encoder)
+            return api_response(result)
+        return run
+    return setup
+
+def bench_nfts_user_schema(size: int) -> Callable[[], Any]:
+    schema = NFTsUserSchema()
+    payloads = generators.nfts_user_args(size)
+    return lambda: [schema.load(payload) for payload in payloads]
+
+def bench_post_vault_schema(size: int) -> Callable[[], Any]:
+    schema = PostVaultSchema()
+    payloads = generators.post_vault_payloads(size)
+    return lambda: [schema.load(payload) for payload in payloads]
+
+def bench_post_vault_schema_large(size: int) -> Callable[[], Any]:
+    """Vault POSTs with up to 100 nfts, the nft addresses dominate"""
+    schema = PostVaultSchema()
+    payloads = generators.post_vault_payloads(size, max_nfts=100)
+    return lambda: [schema.load(payload) for payload in payloads]
+
+def bench_vaults_by_address_schema(size: int) -> Callable[[], Any]:
+    """One vaultsByAddress body with ``size`` addresses, at most MAX_BATCH_VAULTS"""
+    schema = GetVaultsByAddressSchema()
+    payload = generators.vaults_by_address_args(size)
+    return lambda: schema.load(payload)
+
+BENCHMARKS: Dict[str, Callable[[int], Callable[[], Any]]] = {
+    'normalize_nfts': bench_normalize_nfts,
+    'vault_deserialize': bench_vault_deserialize,
+    'vault_record_deserialize': bench_vault_record_deserialize,
+    **{f'api_response[{encoder}]': _bench_api_response(encoder) for encoder in JSON_ENCODERS},
+    'nfts_user_schema': bench_nfts_user_schema,
+    'post_vault_schema': bench_post_vault_schema,
+    'post_vault_schema[large]': bench_post_vault_schema_large,
+    'vaults_by_address_schema': bench_vaults_by_address_schema,
+}
+
+def measure(func: Callable[[], Any], rounds: int) -> Dict[str, Any]:
+    func()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= ROUND_TIME:
+            break
+        number *= 2
+
+    times = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(times), 'min': min(times), 'rounds': rounds, 'number': number}
+
+def run(sizes: List[int], rounds: int, name_filter: Optional[str]) -> List[Dict[str, Any]]:
+    results = []
+    with create_app().test_request_context():
+        for name, setup in BENCHMARKS.items():
+            if name_filter is not None and name_filter not in name:
+                continue
+            for size in sizes:
+                result = {'name': name, 'size': size, **measure(setup(size), rounds)}
+                print(f'{name:28} {size:6} {result["median"] * 1e6:12.1f} us', file=sys.stderr)
+                results.append(result)
+    set_json_encoder('auto')
+    return results
+
+def compare(
+        results: List[Dict[str, Any]],
+        baseline: List[Dict[str, Any]],
+        threshold: float,
+) -> List[Tuple[str, int, float]]:
+    """Print each result next to its baseline and return the regressions"""
+    saved = {(result['name'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = saved.get((result['name'], result['size']))
+        if before is None:
+            continue
+        ratio = result['median'] / before['median']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = 'slower'
+            regressions.append((result['name'], result['size'], ratio))
+        elif ratio < 1 - threshold:
+            mark = 'faster'
+        print(
+            f'{result["name"]:28} {result["size"]:6} '
+            f'{before["median"] * 1e6:12.1f} us -> {result["median"] * 1e6:12.1f} us '
+            f'{ratio:6.2f}x {mark}'
+        )
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--filter', help='Only run the benchmarks whose name contains this')
+    parser.add_argument('--output', help='Write the results as JSON to this file, stdout by default')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--save-baseline', metavar='PATH', help='Save the results as the baseline')
+    group.add_argument('--baseline', metavar='PATH', help='Compare the results with this baseline')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='Relative change of the median above which a result is a regression',
+    )
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': int(time.time()),
+        'results': run(args.sizes, args.rounds, args.filter),
+    }
+    data = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline['results'], args.threshold)
+        if len(regressions) != 0:
+            print(f'{len(regressions)} benchmarks got slower than the baseline', file=sys.stderr)
+            sys.exit(1)
+    elif args.output is None and args.save_baseline is None:
+        print(data)
+
+if __name__ == '__main__':
+    main()
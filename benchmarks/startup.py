@@ -0,0 +1,79 @@
+"""Cold start time: importing the server, creating it and serving a first request
+
+Run from the repository root:
+
+    python -m benchmarks.startup [--runs 5]
+
+Every run is a new interpreter, like a dyno starting. The first request is
+a vaults list, served from the database without calling Covalent.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ('import', 'create', 'first_request')
+
+DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'database', 'database.db')
+
+def child(directory: str) -> None:
+    start = time.perf_counter()
+    from src.cooperative import patch_all
+    patch_all()
+    from src.server import Server
+    imported = time.perf_counter()
+
+    # creating the server adds the missing tables and indexes, so it runs on a copy
+    database = os.path.join(directory, 'database.db')
+    shutil.copyfile(DATABASE, database)
+    logfile = os.path.join(directory, 'startup.log')
+    sys.argv = ['startup', '--covalent-key', 'benchmark', '--logfile', logfile, '--loglevel', 'info']
+    server = Server({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}'})
+    created = time.perf_counter()
+
+    response = server.api_server.flask_app.test_client().get('/v1/43114/vaults')
+    assert response.status_code == 200, response.status_code
+    served = time.perf_counter()
+
+    print(json.dumps({
+        'import': imported - start,
+        'create': created - imported,
+        'first_request': served - created,
+    }))
+
+def run(runs: int) -> dict:
+    times: dict = {phase: [] for phase in PHASES}
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.startup', '--child', directory],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            for phase, elapsed in json.loads(output.splitlines()[-1]).items():
+                times[phase].append(elapsed)
+    return times
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', metavar='DIRECTORY', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        child(args.child)
+        return
+
+    times = run(args.runs)
+    for phase in PHASES:
+        print(f'{phase:14} median {statistics.median(times[phase]) * 1000:8.1f} ms  min {min(times[phase]) * 1000:8.1f} ms')
+    total = [sum(run_times) for run_times in zip(*times.values())]
+    print(f'{"total":14} median {statistics.median(total) * 1000:8.1f} ms  min {min(total) * 1000:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
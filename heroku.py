@@ -1,3 +1,7 @@
+# Must run before anything else imports socket, ssl or threading
+from src.cooperative import patch_all
+patch_all()
+
 import sys
 
 from src.server import Server
@@ -4,16 +4,31 @@ from flask import Flask
 from flask_caching import Cache
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from typing import Any, Dict, Optional
 
 from src.constants.path import PATH_SRC
 
 PATH_DB = os.path.join(PATH_SRC, 'database')
 
-cache = Cache(config={'CACHE_TYPE': 'SimpleCache'})
+# Not bound to an app, create_app does that, so importing them costs nothing
+cache = Cache()
+db = SQLAlchemy()
+cors = CORS()
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////'+os.path.join(PATH_DB, 'database.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-cache.init_app(app)
-db = SQLAlchemy(app)
-cors = CORS(app, resources={r"*": {"origins": "*"}})
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """Create the Flask app and set up the extensions on it
+
+    ``config`` overrides the defaults, e.g. SQLALCHEMY_DATABASE_URI for an
+    in-memory database. The cache starts as the memory one until
+    configure_cache sets the one chosen in the args.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////'+os.path.join(PATH_DB, 'database.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['CACHE_TYPE'] = 'src.api.cache_backend.SizeBoundedCache'
+    if config is not None:
+        app.config.update(config)
+    cache.init_app(app)
+    db.init_app(app)
+    cors.init_app(app, resources={r"*": {"origins": "*"}})
+    return app
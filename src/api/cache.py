@@ -0,0 +1,322 @@
+import argparse
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from flask import Flask, Response, request as flask_request
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.api.app import cache
+from src.api.compression import compress, negotiate_encoding
+from src.api.warmer import warmer
+from src.logging import LogsAdapter
+from src.externalApis.admission import Overloaded
+from src.metrics import CACHE_REQUESTS, STALE_RESPONSES
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+NFTS_CACHE_NAMESPACE = 'getNftsUser'
+
+# Default timeouts of the vault resources, the short one when inserts can't invalidate every worker
+LONG_VAULT_TIMEOUT = 6 * 60 * 60
+SHORT_VAULT_TIMEOUT = 60
+# Timeout in seconds of each cached resource, overridden from the app args
+CACHE_TIMEOUTS = {
+    'nfts': 60,
+    'vault': LONG_VAULT_TIMEOUT,
+    'vaults': LONG_VAULT_TIMEOUT,
+}
+MEMORY_CACHE_TYPE = 'src.api.cache_backend.SizeBoundedCache'
+# Seconds entries are kept after they expire, to be served while upstream is overloaded
+CACHE_STALE_TTL = 10 * 60
+
+class CachedResponse(NamedTuple):
+    """What is kept in the cache for a response: the body and what is needed to rebuild it"""
+    data: bytes
+    status_code: int
+    headers: List[Tuple[str, str]]
+    digest: str
+    # when the entry stops being fresh, as a unix time; None for no limit
+    expires: Optional[float] = None
+
+def _cache_config(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.cache_type == 'redis':
+        try:
+            import redis  # noqa: F401  # pylint: disable=unused-import
+        except ImportError:
+            log.warning('redis is not installed, using the memory cache instead')
+        else:
+            return {
+                'CACHE_TYPE': 'RedisCache',
+                'CACHE_REDIS_URL': args.cache_redis_url,
+                'CACHE_KEY_PREFIX': 'api-fractional-nft:',
+            }
+    elif args.cache_type == 'filesystem':
+        return {
+            'CACHE_TYPE': 'FileSystemCache',
+            'CACHE_DIR': args.cache_dir or os.path.join(tempfile.gettempdir(), 'api-fractional-nft'),
+            'CACHE_THRESHOLD': args.cache_threshold,
+        }
+
+    return {
+        'CACHE_TYPE': MEMORY_CACHE_TYPE,
+        'CACHE_MAX_BYTES': args.cache_max_bytes,
+    }
+
+def configure_cache(app: Flask, args: argparse.Namespace) -> None:
+    """Set up the cache backend and the timeout of each resource from the app args
+
+    Only the redis and filesystem backends are shared between worker
+    processes and dynos. For redis without the redis module installed, the
+    memory cache is used as a local stand-in.
+    """
+    config = _cache_config(args)
+    # Inserts only invalidate the entries of the other workers through a
+    # shared backend, without one they have to expire soon
+    shared = config['CACHE_TYPE'] != MEMORY_CACHE_TYPE
+    vault_timeout = LONG_VAULT_TIMEOUT if shared or args.workers == 1 else SHORT_VAULT_TIMEOUT
+    if not shared and args.workers > 1:
+        log.warning(
+            'Each worker has its own memory cache, inserts are only seen by the other workers once their entries expire',  # noqa: E501
+            workers=args.workers,
+        )
+    CACHE_TIMEOUTS['nfts'] = args.cache_timeout_nfts
+    CACHE_TIMEOUTS['vault'] = vault_timeout if args.cache_timeout_vault is None else args.cache_timeout_vault
+    CACHE_TIMEOUTS['vaults'] = vault_timeout if args.cache_timeout_vaults is None else args.cache_timeout_vaults
+    global CACHE_STALE_TTL
+    CACHE_STALE_TTL = args.cache_stale_ttl
+    log.info('Using cache', backend=config['CACHE_TYPE'], **CACHE_TIMEOUTS)
+    cache.init_app(app, config=config)
+
+def vault_tag(chainID: str, address: str) -> str:
+    return f'vault:{chainID}:{address}'
+
+def vaults_tag(chainID: str) -> str:
+    return f'vaults:{chainID}'
+
+def _tag_version_key(tag: str) -> str:
+    return f'tag-version:{tag}'
+
+def tag_versions(tags: Iterable[str]) -> List[str]:
+    """Get the current version token of each tag
+
+    Versions live in the cache backend itself, so when the backend is shared
+    (redis, filesystem) every process sees the same versions. A missing version
+    (never set or evicted) gets a fresh token, which only invalidates entries.
+    """
+    tags = list(tags)
+    if len(tags) == 0:
+        return []
+
+    keys = [_tag_version_key(tag) for tag in tags]
+    versions = list(cache.get_many(*keys))
+    for i, version in enumerate(versions):
+        if version is None:
+            version = uuid.uuid4().hex
+            # add() so two processes racing on a missing tag agree on one token
+            if not cache.add(keys[i], version, timeout=0):
+                version = cache.get(keys[i]) or version
+            versions[i] = version
+    return versions
+
+def invalidate_tags(*tags: str) -> None:
+    """Purge every cache entry tagged with any of the given tags"""
+    for tag in tags:
+        log.debug('Invalidating cache tag', tag=tag)
+        cache.set(_tag_version_key(tag), uuid.uuid4().hex, timeout=0)
+
+def invalidate_vault(chainID: str, address: str) -> None:
+    """Purge the /vault entry of the given vault and all /vaults pages of its chain"""
+    invalidate_tags(vault_tag(chainID, address), vaults_tag(chainID))
+
+def cache_key(namespace: str, kwargs: Dict[str, Any]) -> str:
+    """Build the cache key of a call from its already validated arguments
+
+    The arguments come out of ``use_kwargs`` so addresses are checksummed and
+    chain ids canonical, and they are sorted so neither the location they
+    were sent in (view args, query string, json) nor their order matters.
+    """
+    args = '&'.join(f'{name}={kwargs[name]}' for name in sorted(kwargs))
+    return f'{namespace}?{args}'
+
+def _to_cached_response(response: Response, timeout: int) -> CachedResponse:
+    data = response.get_data()
+    return CachedResponse(
+        data=data,
+        status_code=response.status_code,
+        headers=[
+            (name, value) for name, value in response.headers.items()
+            if name != 'Content-Length'
+        ],
+        digest=hashlib.blake2b(data, digest_size=16).hexdigest(),
+        expires=time.time() + timeout,
+    )
+
+def _etag(entry: CachedResponse, encoding: Optional[str]) -> str:
+    # Each content coding is a different representation, so it gets its own strong tag
+    return entry.digest if encoding is None else f'{entry.digest}-{encoding}'
+
+def _not_modified(entry: CachedResponse) -> Optional[Response]:
+    """Return a 304 response if the client already has this entry, in any content coding"""
+    if_none_match = flask_request.if_none_match
+    if not if_none_match:
+        return None
+
+    if not if_none_match.star_tag:
+        tags = if_none_match.as_set(include_weak=True)
+        if not any(tag.split('-')[0] == entry.digest for tag in tags):
+            return None
+
+    response = Response(status=304)
+    response.set_etag(_etag(entry, negotiate_encoding(flask_request, len(entry.data))))
+    return response
+
+def get_cached_response(key: str) -> Optional[CachedResponse]:
+    """Get a cached entry, which may be stale: check it with is_fresh"""
+    return cache.get(key)
+
+def is_fresh(entry: CachedResponse) -> bool:
+    return entry.expires is None or entry.expires > time.time()
+
+def set_cached_response(key: str, response: Response, timeout: str) -> CachedResponse:
+    """Cache a response for the timeout of its resource
+
+    Successful responses are kept CACHE_STALE_TTL longer, to be served stale
+    while upstream is overloaded.
+    """
+    entry = _to_cached_response(response, CACHE_TIMEOUTS[timeout])
+    keep = CACHE_TIMEOUTS[timeout]
+    if entry.status_code == 200:
+        keep += CACHE_STALE_TTL
+    cache.set(key, entry, timeout=keep)
+    return entry
+
+def _from_cached_response(key: str, entry: CachedResponse, timeout: int) -> Response:
+    """Build the response for a cached entry, compressed if the client accepts it
+
+    Compressed bodies are cached next to the entry, keyed by its digest so a
+    variant never outlives the body it was made from, and so each body is only
+    compressed once per content coding.
+    """
+    data = entry.data
+    encoding = negotiate_encoding(flask_request, len(data))
+    if encoding is not None:
+        variant_key = f'{key}|{entry.digest}|{encoding}'
+        data = cache.get(variant_key)
+        if data is None:
+            data = compress(entry.data, encoding)
+            cache.set(variant_key, data, timeout=timeout)
+
+    response = Response(data, status=entry.status_code, headers=entry.headers)
+    response.set_etag(_etag(entry, encoding))
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def _versioned_key(key: str, tags: Optional[Callable[..., Iterable[str]]], kwargs: Dict[str, Any]) -> str:
+    if tags is not None:
+        versions = tag_versions(tags(**kwargs))
+        if len(versions) != 0:
+            key += '#' + '.'.join(versions)
+    return key
+
+def _warm_refresh(
+        key: str,
+        tags: Optional[Callable[..., Iterable[str]]],
+        timeout: str,
+        func: Callable,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+) -> Callable[[], bool]:
+    """What the warmer calls to cache the entry again, under the current tag versions"""
+    def refresh() -> bool:
+        response = func(*args, **kwargs)
+        if response.status_code != 200:
+            return False
+        set_cached_response(_versioned_key(key, tags, kwargs), response, timeout)
+        return True
+    return refresh
+
+def cached(
+        timeout: str,
+        tags: Optional[Callable[..., Iterable[str]]] = None,
+        namespace: Optional[str] = None,
+        warm: bool = False,
+        upstream: bool = False,
+) -> Callable:
+    """Cache the response of a resource method, tagging it for later invalidation
+
+    ``timeout`` names the entry of ``CACHE_TIMEOUTS`` to use, looked up on each
+    call so it follows the app args. ``namespace`` prefixes the keys and
+    defaults to the qualified name of the method; set it when other code
+    needs to build the same keys with ``cache_key``.
+
+    Must be applied below ``use_kwargs`` so the key and ``tags`` are built from
+    the parsed arguments. The tag versions are part of the key, so bumping a
+    tag version with ``invalidate_tags`` makes every entry carrying that tag
+    unreachable. The response body is cached rather than the Response object,
+    so entries are cheap to pickle into a shared backend.
+
+    Responses carry a strong ETag made from the body digest. A request whose
+    If-None-Match matches the cached entry gets a 304 without running the
+    resource method or encoding anything.
+
+    When the resource method raises Overloaded and the entry expired less
+    than CACHE_STALE_TTL ago, the expired entry is served instead of the 503.
+
+    With ``warm`` the popular entries are kept fresh by the cache warmer;
+    ``upstream`` tells it that computing the entry queries Covalent, which
+    counts against its budget.
+    """
+    def decorator(func: Callable) -> Callable:
+        key_namespace = namespace or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            base_key = cache_key(key_namespace, kwargs)
+            key = _versioned_key(base_key, tags, kwargs)
+
+            with span('cache.lookup'):
+                entry = get_cached_response(key)
+            stale = None
+            if entry is not None and not is_fresh(entry):
+                stale, entry = entry, None
+            warming = warm and warmer.enabled
+            if warming:
+                warmer.record(base_key, hit=entry is not None)
+            if entry is None:
+                CACHE_REQUESTS.inc(timeout, 'miss')
+                try:
+                    response = func(*args, **kwargs)
+                except Overloaded:
+                    if stale is None or stale.status_code != 200:
+                        raise
+                    STALE_RESPONSES.inc(timeout)
+                    entry = stale
+                else:
+                    entry = set_cached_response(key, response, timeout)
+                    if warming and entry.status_code == 200:
+                        warmer.track(
+                            key=base_key,
+                            resource=timeout,
+                            refresh=_warm_refresh(base_key, tags, timeout, func, args, kwargs),
+                            timeout=CACHE_TIMEOUTS[timeout],
+                            upstream=upstream,
+                        )
+            else:
+                CACHE_REQUESTS.inc(timeout, 'hit')
+
+            not_modified = _not_modified(entry)
+            if not_modified is not None:
+                return not_modified
+            return _from_cached_response(key, entry, CACHE_TIMEOUTS[timeout])
+
+        return wrapper
+
+    return decorator
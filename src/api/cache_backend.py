@@ -0,0 +1,106 @@
+import pickle
+
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask
+from flask_caching.backends.base import BaseCache
+
+from src.metrics import CACHE_EVICTIONS, CACHE_SIZE
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class SizeBoundedCache(BaseCache):
+    """Memory cache bounded by the size of what it holds rather than the number of items
+
+    Values are pickled, like in SimpleCache, and the pickled size is what is
+    counted. When a set goes above ``max_bytes`` the least recently used
+    entries are evicted until it fits. NFT payloads vary from a few bytes to
+    megabytes of inline images, so an item count says nothing about memory.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, default_timeout: int = 300) -> None:
+        super().__init__(default_timeout)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._cache: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+
+    @classmethod
+    def factory(
+            cls,
+            app: Flask,
+            config: Dict[str, Any],
+            args: Any,
+            kwargs: Dict[str, Any],
+    ) -> 'SizeBoundedCache':
+        kwargs.update({'max_bytes': config.get('CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)})
+        return cls(*args, **kwargs)
+
+    def _normalize_timeout(self, timeout: Optional[int]) -> float:
+        timeout = BaseCache._normalize_timeout(self, timeout)
+        if timeout > 0:
+            timeout = time() + timeout
+        return timeout
+
+    def _pop(self, key: str) -> bool:
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return False
+        self.size -= len(key) + len(entry[1])
+        CACHE_SIZE.set(self.size)
+        return True
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and len(self._cache) != 0:
+            key, (_, data) = self._cache.popitem(last=False)
+            self.size -= len(key) + len(data)
+            self.evictions += 1
+            CACHE_EVICTIONS.inc()
+
+    def get(self, key: str) -> Any:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+
+        expires, data = entry
+        if expires != 0 and expires <= time():
+            self._pop(key)
+            return None
+
+        self._cache.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        expires = self._normalize_timeout(timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._pop(key)
+        if len(key) + len(data) > self.max_bytes:
+            return False
+
+        self._cache[key] = (expires, data)
+        self.size += len(key) + len(data)
+        self._evict()
+        CACHE_SIZE.set(self.size)
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key: str) -> bool:
+        return self._pop(key)
+
+    def has(self, key: str) -> bool:
+        entry = self._cache.get(key)
+        if entry is None:
+            return False
+        return entry[0] == 0 or entry[0] > time()
+
+    def clear(self) -> bool:
+        self._cache.clear()
+        self.size = 0
+        CACHE_SIZE.set(self.size)
+        return True
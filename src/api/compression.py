@@ -0,0 +1,60 @@
+import gzip
+
+from flask import Request, Response
+from typing import List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this size the compressed body is barely smaller and not worth the CPU
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def supported_encodings() -> List[str]:
+    """Content codings the server can produce, in order of preference"""
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+def negotiate_encoding(request: Request, size: int) -> Optional[str]:
+    """Pick the content coding for a body of the given size from Accept-Encoding
+
+    Returns None when the body should be sent as is.
+    """
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    return request.accept_encodings.best_match(supported_encodings())
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    raise ValueError(f'Unsupported content coding {encoding}')
+
+def compress_response(request: Request, response: Response) -> Response:
+    """Flask.after_request hook compressing the responses not served from the cache
+
+    Cached responses come out already compressed, with Content-Encoding set.
+    """
+    response.vary.add('Accept-Encoding')
+    if (
+        response.direct_passthrough or
+        response.is_streamed or
+        'Content-Encoding' in response.headers or
+        response.status_code < 200 or
+        response.status_code in (204, 304)
+    ):
+        return response
+
+    data = response.get_data()
+    encoding = negotiate_encoding(request, len(data))
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
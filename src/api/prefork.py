@@ -0,0 +1,206 @@
+import errno
+import logging
+import os
+import signal
+import socket
+import time
+
+import gevent
+import gevent.event
+from gevent.os import fork_gevent
+from gevent.pywsgi import WSGIServer
+from typing import Callable, Dict, Optional
+
+from src.logging import LogsAdapter, log_writer
+from src.metrics import registry
+from src.tracing import exporter
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+HEARTBEAT_INTERVAL = 2
+HEARTBEAT_TIMEOUT = 30
+SUPERVISE_INTERVAL = 1
+LISTEN_BACKLOG = 1024
+
+def create_listener(host: str, port: int) -> socket.socket:
+    """Create the listening socket shared by all workers
+
+    It is non blocking since every worker waits on it: when a connection
+    arrives all of them wake up and only one gets it, the rest must not block.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.setblocking(False)
+    return sock
+
+class _Worker():
+    def __init__(self, pid: int, heartbeat_fd: int) -> None:
+        self.pid = pid
+        self.heartbeat_fd = heartbeat_fd
+        self.last_heartbeat = time.monotonic()
+        self.stopping = False
+
+class PreforkServer():
+    """Forks N gevent WSGIServer workers that accept on one inherited socket
+
+    The parent process only supervises: it restarts workers that die, kills
+    the ones whose gevent hub stopped sending heartbeats (something blocked
+    it) and replaces them one by one on a graceful restart.
+
+    Forked workers keep the signal handlers of the parent, so ``stop`` and
+    ``reload`` know in which process they run: in a worker ``stop`` stops its
+    own WSGIServer gracefully and ``reload`` does nothing.
+    """
+
+    def __init__(
+            self,
+            listener: socket.socket,
+            make_server: Callable[[socket.socket], WSGIServer],
+            workers: int,
+            heartbeat_timeout: int = HEARTBEAT_TIMEOUT,
+    ) -> None:
+        self.listener = listener
+        self.make_server = make_server
+        self.workers_num = workers
+        self.heartbeat_timeout = heartbeat_timeout
+        self.workers: Dict[int, _Worker] = {}
+        self.wsgiserver: Optional[WSGIServer] = None
+        self.running = False
+        self.reload_requested = False
+        self.stopped = gevent.event.Event()
+
+    def _spawn_worker(self) -> None:
+        read_fd, write_fd = os.pipe()
+        pid = fork_gevent()
+        if pid == 0:
+            os.close(read_fd)
+            os.set_blocking(write_fd, False)
+            log_writer.after_fork()
+            exporter.after_fork()
+            registry.worker = str(os.getpid())
+            self._run_worker(write_fd)
+            exporter.stop()
+            log_writer.stop()
+            os._exit(0)
+
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        self.workers[pid] = _Worker(pid=pid, heartbeat_fd=read_fd)
+        log.info('Started worker', pid=pid)
+
+    def _run_worker(self, heartbeat_fd: int) -> None:
+        self.running = False
+        for worker in self.workers.values():
+            os.close(worker.heartbeat_fd)
+        self.workers = {}
+
+        self.wsgiserver = self.make_server(self.listener)
+
+        def heartbeat() -> None:
+            while True:
+                try:
+                    os.write(heartbeat_fd, b'.')
+                except BlockingIOError:
+                    pass  # pipe is full, supervisor has plenty of heartbeats to read
+                except OSError:
+                    # supervisor is gone, nothing left to serve for
+                    self.stop()
+                    return
+                gevent.sleep(HEARTBEAT_INTERVAL)
+
+        gevent.spawn(heartbeat)
+        self.wsgiserver.serve_forever()
+
+    def _reap_workers(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.heartbeat_fd)
+            if not worker.stopping:
+                log.warning('Worker exited unexpectedly', pid=pid, status=status)
+
+    def _read_heartbeats(self) -> None:
+        now = time.monotonic()
+        for worker in self.workers.values():
+            try:
+                if os.read(worker.heartbeat_fd, 1024):
+                    worker.last_heartbeat = now
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+            if now - worker.last_heartbeat > self.heartbeat_timeout and not worker.stopping:
+                log.warning('Worker stopped sending heartbeats, killing it', pid=worker.pid)
+                self._signal_worker(worker, signal.SIGKILL)
+
+    @staticmethod
+    def _signal_worker(worker: _Worker, signum: int) -> None:
+        worker.stopping = True
+        try:
+            os.kill(worker.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _replace_workers(self) -> None:
+        """Start a new worker before telling each old one to stop, so there
+        is always someone accepting on the socket"""
+        log.info('Graceful restart of workers')
+        for worker in list(self.workers.values()):
+            if worker.stopping:
+                continue
+            self._spawn_worker()
+            self._signal_worker(worker, signal.SIGTERM)
+
+    def serve_forever(self) -> None:
+        # Workers are only forked from here, the greenlet that keeps running
+        # in the child must be the one that would return from serve_forever
+        self.running = True
+        while self.running:
+            self._reap_workers()
+            self._read_heartbeats()
+            if self.reload_requested:
+                self.reload_requested = False
+                self._replace_workers()
+            while self.running and len(self.workers) < self.workers_num:
+                self._spawn_worker()
+            gevent.sleep(SUPERVISE_INTERVAL)
+        self.stopped.wait()
+
+    def reload(self) -> None:
+        """Gracefully replace every worker, one at a time"""
+        if self.wsgiserver is None:
+            self.reload_requested = True
+
+    def stop(self, timeout: int = 5) -> None:
+        """Stops all workers. If they are running after timeout they are killed"""
+        if self.wsgiserver is not None:
+            self.wsgiserver.stop(timeout)
+            return
+
+        self.running = False
+        for worker in self.workers.values():
+            self._signal_worker(worker, signal.SIGTERM)
+
+        deadline = time.monotonic() + timeout
+        while len(self.workers) != 0 and time.monotonic() < deadline:
+            self._reap_workers()
+            gevent.sleep(0.1)
+
+        for worker in list(self.workers.values()):
+            self._signal_worker(worker, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+            os.close(worker.heartbeat_fd)
+        self.workers = {}
+        self.listener.close()
+        self.stopped.set()
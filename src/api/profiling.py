@@ -0,0 +1,76 @@
+import argparse
+import cProfile
+import logging
+import os
+import random
+import time
+
+from flask import Request
+from typing import Any, Callable
+
+from src.logging import LogsAdapter
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+PROFILE_HEADER = 'X-Profile'
+
+class Profiler():
+    """Profiles requests on demand and saves them as pstats files
+
+    A request is profiled when profiling is enabled and it either has the
+    X-Profile header or it is picked by the sample rate. Only one request is
+    profiled at a time: the profiler hooks the whole thread, so while the
+    request waits on I/O the greenlets that run in between show up in its
+    profile too.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.directory = 'profiles'
+        self.sample_rate = 0.0
+        self.max_files = 100
+        self.active = False
+
+    def configure(self, args: argparse.Namespace) -> None:
+        self.enabled = args.profiling
+        self.directory = args.profile_dir
+        self.sample_rate = args.profile_sample_rate
+        self.max_files = args.profile_max_files
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            log.info('Request profiling enabled', directory=self.directory, sample_rate=self.sample_rate)
+
+    def should_profile(self, request: Request) -> bool:
+        if not self.enabled or self.active:
+            return False
+        if PROFILE_HEADER in request.headers:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile(self, name: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        profile = cProfile.Profile()
+        self.active = True
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self.active = False
+            self._save(profile, name)
+
+    def _save(self, profile: cProfile.Profile, name: str) -> None:
+        path = os.path.join(self.directory, f'{time.time_ns()}-{name}.pstats')
+        try:
+            profile.dump_stats(path)
+            self._prune()
+        except OSError as e:
+            log.warning('Could not save request profile', path=path, error=str(e))
+            return
+        log.debug('Saved request profile', path=path)
+
+    def _prune(self) -> None:
+        """Remove the oldest profiles so that at most max_files are kept"""
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.pstats'))
+        for name in files[:max(len(files) - self.max_files, 0)]:
+            os.remove(os.path.join(self.directory, name))
+
+profiler = Profiler()
@@ -1,17 +1,69 @@
+import contextvars
+import itertools
 import json
 import logging
 
-from flask import Response, make_response
+from flask import Response, make_response, stream_with_context
+from gevent.pool import Pool
 from http import HTTPStatus
-from typing import Any, Dict, List, Optional
+from marshmallow.exceptions import ValidationError
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from src.api.cache import (
+    NFTS_CACHE_NAMESPACE,
+    CachedResponse,
+    cache_key,
+    get_cached_response,
+    is_fresh,
+    set_cached_response,
+)
+from src.api.submissions import submission_worker
+from src.api.v1.encoding import EthereumAddressField
 from src.api_functions import Api_functions
+from src.externalApis.admission import Overloaded
 from src.logging import LogsAdapter
+from src.metrics import CACHE_REQUESTS, STALE_RESPONSES
+from src.tracing import span
 from src.typing import ChecksumAVAXAddress
 
 logger = logging.getLogger(__name__)
 log = LogsAdapter(logger)
 
+# How many upstream queries a batch request runs at the same time
+BATCH_CONCURRENCY = 8
+
+_address_field = EthereumAddressField()
+
+def _stdlib_json_encoder(result: Any) -> bytes:
+    return json.dumps(result).encode('utf-8')
+
+def _orjson_encoder(result: Any) -> bytes:
+    try:
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # e.g. integers above 64 bits, which the stdlib encoder handles
+        return _stdlib_json_encoder(result)
+
+JSON_ENCODERS: Dict[str, Callable[[Any], bytes]] = {'json': _stdlib_json_encoder}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _orjson_encoder
+
+_json_encoder = JSON_ENCODERS['orjson' if orjson is not None else 'json']
+
+def set_json_encoder(name: str) -> None:
+    """Select the encoder api_response uses. 'auto' is the fastest available"""
+    global _json_encoder
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_ENCODERS else 'json'
+    if name not in JSON_ENCODERS:
+        raise ValueError(f'JSON encoder {name} is not available')
+    _json_encoder = JSON_ENCODERS[name]
+
 def _wrap_in_ok_result(result: Any) -> Dict[str, Any]:
     return {'result': result, 'message': ''}
 
@@ -31,14 +83,21 @@ def api_response(
 ) -> Response:
     if status_code == HTTPStatus.NO_CONTENT:
         assert not result, "Provided 204 response with non-zero length response"
-        data = ""
+        data = b""
     else:
-        data = json.dumps(result)
+        with span('serialization'):
+            data = _json_encoder(result)
         
     return make_response(
         (data, status_code, {"mimetype": "application/json", "Content-Type": "application/json"}),
     )
 
+def overloaded_response(exception: Overloaded) -> Response:
+    """The 503 for a request whose upstream queries were shed by the admission control"""
+    response = api_response(wrap_in_fail_result(str(exception)), HTTPStatus.SERVICE_UNAVAILABLE)
+    response.headers['Retry-After'] = str(exception.retry_after)
+    return response
+
 class RestAPI():
     def __init__(self, api_functions: Api_functions) -> None:
         self.api_functions = api_functions
@@ -50,6 +109,110 @@ class RestAPI():
             )
         )
     
+    def getnfts_stream(self, address: ChecksumAVAXAddress, chainID: str) -> Response:
+        """Stream the nfts of an address as NDJSON, one line per nft, as they are normalized
+
+        The first nft, and so the first upstream page, is fetched before the
+        response starts: a shed query is then a 503, or the nfts of the
+        expired getNftsUser entry. The status line is sent before the other
+        pages are fetched, so a failure midway ends the stream with an
+        ``{"error": ...}`` line instead.
+        """
+        nfts = self.api_functions.iter_nfts_user(address, chainID)
+        error: Optional[Exception] = None
+        try:
+            nfts = itertools.chain(list(itertools.islice(nfts, 1)), nfts)
+        except Overloaded:
+            entry = get_cached_response(cache_key(NFTS_CACHE_NAMESPACE, {'address': address, 'chainID': chainID}))
+            if entry is None or entry.status_code != HTTPStatus.OK:
+                raise
+            STALE_RESPONSES.inc('nfts')
+            nfts = iter(json.loads(entry.data)['result']['items'])
+        except Exception as e:  # pylint: disable=broad-except
+            nfts, error = iter(()), e
+
+        def generate(error: Optional[Exception]) -> Iterator[bytes]:
+            try:
+                for item in nfts:
+                    yield _json_encoder(item) + b'\n'
+            except Exception as e:  # pylint: disable=broad-except
+                error = e
+            if error is not None:
+                log.error('getNftsUser stream failed', address=address, exc_info=error)
+                yield _json_encoder({'error': str(error)}) + b'\n'
+
+        # the request context, and so its trace, stays open until the stream ends
+        return Response(stream_with_context(generate(error)), mimetype='application/x-ndjson')
+
+    def _getnfts_query(
+            self,
+            address: ChecksumAVAXAddress,
+            chainID: str,
+            stale: Optional[CachedResponse],
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str], bool]:
+        """Returns the result and the error message, one of them None, and
+        whether the result is the stale entry, served since upstream was overloaded"""
+        try:
+            return self.api_functions.get_nfts_user(address, chainID), None, False
+        except Overloaded as e:
+            if stale is not None and stale.status_code == HTTPStatus.OK:
+                STALE_RESPONSES.inc('nfts')
+                return json.loads(stale.data)['result'], None, True
+            return None, str(e), False
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning('Batch getNftsUser query failed', address=address, error=str(e))
+            return None, str(e), False
+
+    def getnfts_batch(self, chainID: str, addresses: List[str]) -> Response:
+        """Get the nfts of many addresses
+
+        Addresses in the getNftsUser cache are served right away and the rest
+        are queried with at most BATCH_CONCURRENCY upstream calls at a time,
+        then cached for later single or batch requests. Each address gets its
+        own result and error, in the order they were given. An address whose
+        query was shed gets its expired entry, if there is one, or an error.
+        """
+        results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]] = {}
+        checksummed: Dict[str, ChecksumAVAXAddress] = {}
+        for address in addresses:
+            try:
+                checksummed[address] = _address_field.deserialize(address)
+            except ValidationError as e:
+                results[address] = (None, ','.join(e.messages))
+
+        pool = Pool(BATCH_CONCURRENCY)
+        queries = {}
+        for address in set(checksummed.values()):
+            key = cache_key(NFTS_CACHE_NAMESPACE, {'address': address, 'chainID': chainID})
+            entry = get_cached_response(key)
+            stale = None
+            if entry is not None and not is_fresh(entry):
+                stale, entry = entry, None
+            CACHE_REQUESTS.inc('nfts', 'miss' if entry is None else 'hit')
+            if entry is None:
+                # copy the context so the query spans land in this request trace
+                queries[key] = (address, pool.spawn(
+                    contextvars.copy_context().run, self._getnfts_query, address, chainID, stale,
+                ))
+            elif entry.status_code != HTTPStatus.OK:
+                results[address] = (None, json.loads(entry.data)['message'])
+            else:
+                results[address] = (json.loads(entry.data)['result'], None)
+        pool.join()
+
+        for key, (address, greenlet) in queries.items():
+            result, error, from_stale = greenlet.value
+            results[address] = (result, error)
+            if error is None and not from_stale:
+                set_cached_response(key, api_response(_wrap_in_ok_result(result)), 'nfts')
+
+        items = []
+        for address in addresses:
+            address = checksummed.get(address, address)
+            result, error = results[address]
+            items.append({'address': address, 'result': result, 'error': error})
+        return api_response(_wrap_in_ok_result({'chainID': int(chainID), 'items': items}))
+
     def getVault(self, address: ChecksumAVAXAddress, chainID: str):
         return api_response(
             _wrap_in_ok_result(
@@ -57,10 +220,29 @@ class RestAPI():
             )
         )
     
-    def insert_vault(self, chainID: str, vault: Dict[str, Any]):
-        success, message = self.api_functions.insertVault(chainID=chainID, vault=vault)
-        status_code = HTTPStatus.CREATED if success else HTTPStatus.BAD_REQUEST
-        return api_response(_wrap_in_result("", message), status_code)
+    def getVaultsByAddress(self, chainID: str, addresses: List[ChecksumAVAXAddress]):
+        return api_response(
+            _wrap_in_ok_result(
+                self.api_functions.getVaultsByAddress(addresses=addresses, chainID=chainID)
+            )
+        )
+
+    def submit_vault(self, chainID: str, vault: Dict[str, Any]) -> Response:
+        """Accept a vault to be verified and inserted by the submission workers"""
+        submission, message = self.api_functions.submitVault(chainID=chainID, vault=vault)
+        if submission is None:
+            return api_response(wrap_in_fail_result(message), HTTPStatus.BAD_REQUEST)
+
+        submission_worker.notify()
+        response = api_response(_wrap_in_result(submission, message), HTTPStatus.ACCEPTED)
+        response.headers['Location'] = f'/v1/vaultSubmission/{submission["id"]}'
+        return response
+
+    def get_vault_submission(self, submission_id: str) -> Response:
+        submission = self.api_functions.getVaultSubmission(submission_id)
+        if submission is None:
+            return api_response(wrap_in_fail_result('Submission not found'), HTTPStatus.NOT_FOUND)
+        return api_response(_wrap_in_ok_result(submission))
 
     def getVaults(self, chainID: str, page: int, perpage: int):
         return api_response(
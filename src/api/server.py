@@ -2,26 +2,35 @@ import gevent
 import json
 import logging
 import os
+import time
 import werkzeug
 
 from http import HTTPStatus
-from flask import Flask, Response, request
+from flask import Flask, Response, current_app, g, request
 from flask_restful import Api, Resource, abort
 from gevent.pywsgi import WSGIServer
 from marshmallow import Schema
 from marshmallow.exceptions import ValidationError
 from typing import Any, Dict, List, Optional, Tuple, Union
-from webargs.flaskparser import parser
 from werkzeug.exceptions import NotFound
 
 from src.logging import LogsAdapter
-from src.api.app import app
+from src.metrics import REQUEST_LATENCY, REQUESTS, REQUESTS_IN_FLIGHT, registry
+from src.tracing import finish_trace, start_trace
+from src.api.app import create_app
+from src.api.compression import compress_response
+from src.api.prefork import PreforkServer, create_listener
 from src.api.rest import RestAPI, api_response, wrap_in_fail_result
-from src.api.v1.parser import resource_parser
+from src.api.submissions import submission_worker
+from src.api.v1.parser import parser, resource_parser
+from src.externalApis.admission import admission
 from src.api.v1.resources import (
     NFTsUserResource,
+    NFTsUsersResource,
     VaultResource,
     VaultsResource,
+    VaultsByAddressResource,
+    VaultSubmissionResource,
     create_blueprint,
 )
 
@@ -35,6 +44,12 @@ URLS = [
         NFTsUserResource, 
         "named_getNftsUser_resource"
     ),
+    ('/getNftsUsers', NFTsUsersResource),
+    (
+        '/<string:chainID>/getNftsUsers',
+        NFTsUsersResource,
+        "named_getNftsUsers_resource"
+    ),
     ('/vault', VaultResource),
     (
         '/<string:chainID>/vault', 
@@ -47,6 +62,13 @@ URLS = [
         VaultsResource, 
         "named_vaults_resource"
     ),
+    ('/vaultsByAddress', VaultsByAddressResource),
+    (
+        '/<string:chainID>/vaultsByAddress',
+        VaultsByAddressResource,
+        "named_vaultsByAddress_resource"
+    ),
+    ('/vaultSubmission/<string:id>', VaultSubmissionResource),
 ]
 
 def setup_urls(
@@ -75,6 +97,51 @@ def endpoint_not_found(e: 'NotFound') -> Response:
     msg = e.description if isinstance(e, NotFound) else 'invalid endpoint'
     return api_response(wrap_in_fail_result(msg), HTTPStatus.NOT_FOUND)
 
+def metrics_endpoint() -> Response:
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def _resource_name() -> str:
+    """Name of the resource class serving the request, the same for all its routes"""
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    view_class = getattr(view, 'view_class', None)
+    if view_class is not None:
+        return view_class.__name__
+    return request.endpoint or 'unknown'
+
+def record_request_start() -> None:
+    g.request_start_time = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+def record_request_end(response: Response) -> Response:
+    resource = _resource_name()
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_start_time, resource)
+    REQUESTS.inc(resource, request.method, str(response.status_code))
+    return response
+
+def record_request_teardown(_exception: Optional[BaseException]) -> None:
+    if 'request_start_time' in g:
+        REQUESTS_IN_FLIGHT.dec()
+
+def start_request_trace() -> None:
+    g.trace_root = start_trace(
+        'request',
+        request_id=request.headers.get('X-Request-ID'),
+        method=request.method,
+        path=request.path,
+    )
+
+def end_request_trace(response: Response) -> Response:
+    root = g.trace_root
+    root.attributes['resource'] = _resource_name()
+    root.attributes['status_code'] = response.status_code
+    response.headers['X-Request-ID'] = root.trace.request_id
+    response.headers['Server-Timing'] = root.trace.server_timing(root)
+    return response
+
+def finish_request_trace(_exception: Optional[BaseException]) -> None:
+    if 'trace_root' in g:
+        finish_trace(g.trace_root)
+
 @parser.error_handler  # type: ignore
 @resource_parser.error_handler
 def handle_request_parsing_error(
@@ -105,8 +172,10 @@ class APIServer():
     def __init__(
             self,
             rest_api: RestAPI,
+            flask_app: Optional[Flask] = None,
     ) -> None:
-        flask_app = app
+        if flask_app is None:
+            flask_app = create_app()
         blueprint_v1 = create_blueprint()
         flask_api_context = Api(blueprint_v1)
         setup_urls(
@@ -118,12 +187,22 @@ class APIServer():
         self.flask_app = flask_app
         
         self.wsgiserver: Optional[WSGIServer] = None
+        self.prefork: Optional[PreforkServer] = None
         
         self.blueprint_v1 = blueprint_v1
         self.flask_app.register_blueprint(self.blueprint_v1, url_prefix='/v1')
         
         self.flask_app.errorhandler(HTTPStatus.NOT_FOUND)(endpoint_not_found)
         self.flask_app.register_error_handler(Exception, self.unhandled_exception)
+        self.flask_app.before_request(admission.start_deadline)
+        self.flask_app.after_request(lambda response: compress_response(request, response))
+        self.flask_app.before_request(record_request_start)
+        self.flask_app.after_request(record_request_end)
+        self.flask_app.teardown_request(record_request_teardown)
+        self.flask_app.before_request(start_request_trace)
+        self.flask_app.after_request(end_request_trace)
+        self.flask_app.teardown_request(finish_request_trace)
+        self.flask_app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
 
     @staticmethod
     def unhandled_exception(exception: Exception) -> Response:
@@ -142,32 +221,54 @@ class APIServer():
         log.info('Local run')
         self.flask_app.run(host=host, port=port, debug=True, **kwargs)
         
-    def run_heroku(self) -> None:
+    def run_heroku(self, workers: int = 1) -> None:
         """This is only used  to run in heroku"""
         host = '0.0.0.0'
         port = int(os.environ.get('PORT', 5000))
-        self.start(host, port)
+        self.start(host, port, workers)
 
-    def start(
-            self,
-            host: str = '127.0.0.1',
-            port: int = 5042,
-    ) -> None:
+    def _create_wsgiserver(self, listener: Any) -> WSGIServer:
+        # called in each process that serves requests, after any fork
+        submission_worker.start()
         wsgi_logger = logging.getLogger(__name__ + '.pywsgi')
-        self.wsgiserver = WSGIServer(
-            listener=(host, port),
+        return WSGIServer(
+            listener=listener,
             application=self.flask_app,
             log=wsgi_logger,
             error_log=wsgi_logger,
         )
+
+    def start(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 5042,
+            workers: int = 1,
+    ) -> None:
         msg = f'REST API server is running at: {host}:{port}'
         print(msg)
-        log.info(msg)
+        log.info(msg, workers=workers)
+        if workers > 1:
+            self.prefork = PreforkServer(
+                listener=create_listener(host, port),
+                make_server=self._create_wsgiserver,
+                workers=workers,
+            )
+            self.prefork.serve_forever()
+            return
+
         #create server 
+        self.wsgiserver = self._create_wsgiserver((host, port))
         self.wsgiserver.serve_forever()
 
+    def reload(self) -> None:
+        """Gracefully restarts the workers when running with more than one"""
+        if self.prefork is not None:
+            self.prefork.reload()
+
     def stop(self, timeout: int = 5) -> None:
         """Stops the API server. If handlers are running after timeout they are killed"""
+        if self.prefork is not None:
+            self.prefork.stop(timeout)
         if self.wsgiserver is not None:
             self.wsgiserver.stop(timeout)
             self.wsgiserver = None
@@ -0,0 +1,88 @@
+import argparse
+import logging
+import os
+import time
+
+import gevent
+import gevent.event
+
+from flask import Flask
+from typing import Optional
+
+from src.api_functions import Api_functions
+from src.database.Model import db_claim_submission
+from src.externalApis.admission import Overloaded
+from src.logging import LogsAdapter
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+# Seconds between looks for submissions left by other processes or restarts
+POLL_INTERVAL = 5
+# A submission verifying for longer than this was left by a process that died
+STALE_CLAIM = 5 * 60
+
+class SubmissionWorker():
+    """Pool of greenlets verifying and inserting the vault submissions
+
+    Submissions live in the database, so any worker process can take them
+    and none is lost on a restart. A submission is claimed with a conditional
+    update, which only one process wins. New submissions wake up the pool of
+    the process that received them; the rest are found by polling.
+    """
+
+    def __init__(self) -> None:
+        self.workers = 2
+        self.app: Optional[Flask] = None
+        self.api_functions: Optional[Api_functions] = None
+        self._wakeup = gevent.event.Event()
+        self._pid: Optional[int] = None
+
+    def configure(self, app: Flask, api_functions: Api_functions, args: argparse.Namespace) -> None:
+        self.app = app
+        self.api_functions = api_functions
+        self.workers = args.vault_workers
+
+    def start(self) -> None:
+        """Start the pool in this process, one that serves requests
+
+        Each prefork worker starts its own after the fork. The supervisor
+        starts none: what it inserted and invalidated would only reach its
+        own cache and vault index, which never serve a request.
+        """
+        self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if self.app is None:
+            return  # not configured
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._wakeup = gevent.event.Event()
+        for _ in range(self.workers):
+            gevent.spawn(self._work, self._pid)
+
+    def notify(self) -> None:
+        """A submission was saved, have an idle greenlet take it"""
+        self._ensure_running()
+        self._wakeup.set()
+
+    def _work(self, pid: int) -> None:
+        while os.getpid() == pid:
+            try:
+                with self.app.app_context():  # type: ignore  # set in configure
+                    submission = db_claim_submission(time.time() - STALE_CLAIM)
+                    if submission is not None:
+                        self.api_functions.processVaultSubmission(submission)  # type: ignore  # set in configure
+            except Overloaded as e:
+                gevent.sleep(e.retry_after)
+                continue
+            except Exception:  # pylint: disable=broad-except
+                log.error('Vault submission worker failed', exc_info=True)
+                submission = None
+
+            if submission is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+
+submission_worker = SubmissionWorker()
@@ -1,7 +1,8 @@
+import functools
 import logging
 
 from eth_utils import to_checksum_address
-from marshmallow import Schema, fields, post_load
+from marshmallow import Schema, fields, post_load, validate
 from marshmallow.exceptions import ValidationError
 from typing import Any, Dict, List, NamedTuple, Optional, Mapping
 
@@ -10,6 +11,27 @@ from src.typing import ChecksumAVAXAddress
 
 log = logging.getLogger(__name__)
 
+MAX_BATCH_ADDRESSES = 500
+MAX_BATCH_VAULTS = 300
+# Addresses whose checksum is remembered, about 200 bytes each
+CHECKSUM_CACHE_SIZE = 32768
+
+@functools.lru_cache(maxsize=CHECKSUM_CACHE_SIZE)
+def _checksum_address(value: Any) -> ChecksumAVAXAddress:
+    return to_checksum_address(value)
+
+def checksum_address(value: Any) -> ChecksumAVAXAddress:
+    """to_checksum_address, remembering the most recent addresses
+
+    The checksum is a keccak hash of the address, and the same addresses come
+    in again and again: the vaults, their nfts and the users looking at them.
+    Strings are lowercased first so that any casing of an address is one
+    entry. Invalid values raise like to_checksum_address and are not cached.
+    """
+    if isinstance(value, str):
+        value = value.lower()
+    return _checksum_address(value)
+
 class EthereumAddressField(fields.Field):
 
     def _deserialize(
@@ -21,7 +43,7 @@ class EthereumAddressField(fields.Field):
     ) -> ChecksumAVAXAddress:
         # Make sure that given value is an ethereum address
         try:
-            address = to_checksum_address(value)
+            address = checksum_address(value)
         except (ValueError, TypeError) as e:
             raise ValidationError(
                 f'Given value {value} is not an ethereum address',
@@ -52,6 +74,19 @@ class NFTsUserSchema(Schema):
     address = EthereumAddressField(required=True)
     chainID = ChainIdField(load_default="43114")
 
+class GetNFTsUserSchema(NFTsUserSchema):
+    # ndjson streams the nfts one per line, following the upstream pagination
+    format = fields.String(load_default='json', validate=validate.OneOf(['json', 'ndjson']))
+
+class NFTsUsersSchema(Schema):
+    chainID = ChainIdField(load_default="43114")
+    # Validated one by one so an invalid address only fails its own result
+    addresses = fields.List(
+        fields.String(),
+        required=True,
+        validate=validate.Length(min=1, max=MAX_BATCH_ADDRESSES),
+    )
+
 class NftSchema(Schema):
     address = EthereumAddressField(required=True)
     name = fields.String(required=True)
@@ -70,7 +105,18 @@ class PostVaultSchema(Schema):
     curator_address = EthereumAddressField(required=True)
     nfts = fields.List(fields.Nested(NftSchema), required=True)
 
+class VaultSubmissionSchema(Schema):
+    id = fields.String(required=True, validate=validate.Length(min=1, max=64))
+
 class GetVaultsSchema(Schema):
     chainID = ChainIdField(required=True)
     page = fields.Integer(load_default=1)
     perpage = fields.Integer(load_default=15)
+
+class GetVaultsByAddressSchema(Schema):
+    chainID = ChainIdField(required=True)
+    addresses = fields.List(
+        EthereumAddressField(),
+        required=True,
+        validate=validate.Length(min=1, max=MAX_BATCH_VAULTS),
+    )
@@ -12,6 +12,20 @@ from webargs.core import (
 )
 from webargs.flaskparser import FlaskParser
 
+from src.tracing import span
+
+
+class TracedFlaskParser(FlaskParser):
+    """A FlaskParser that times the loading and validation of the arguments as a tracing span"""
+
+    def parse(self, *args: Any, **kwargs: Any) -> Any:
+        with span('validation'):
+            return super().parse(*args, **kwargs)
+
+
+parser = TracedFlaskParser()
+use_kwargs = parser.use_kwargs
+
 
 class ResourceReadingParser(FlaskParser):
     """A version of FlaskParser that can access the resource object it decorates"""
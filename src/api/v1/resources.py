@@ -3,16 +3,23 @@ from flask_restful import Resource
 from marshmallow import Schema
 from marshmallow.utils import missing
 from typing import Any, Dict, List, Optional, Union
-from webargs.flaskparser import parser, use_kwargs
 from webargs.multidictproxy import MultiDictProxy
+from werkzeug.exceptions import abort
 
 from src.typing import ChecksumAVAXAddress
-from src.api.app import cache
-from src.api.rest import RestAPI
+from src.api.cache import NFTS_CACHE_NAMESPACE, cached, vault_tag, vaults_tag
+from src.api.profiling import profiler
+from src.api.rest import RestAPI, overloaded_response
+from src.api.v1.parser import parser, use_kwargs
+from src.externalApis.admission import Overloaded
 from src.api.v1.encoding import (
+    GetNFTsUserSchema,
     NFTsUserSchema,
+    NFTsUsersSchema,
     PostVaultSchema,
     GetVaultsSchema,
+    GetVaultsByAddressSchema,
+    VaultSubmissionSchema,
 )
 
 def _combine_parser_data(
@@ -70,34 +77,54 @@ def create_blueprint() -> Blueprint:
     # http://stackoverflow.com/questions/28795561/support-multiple-api-versions-in-flask#28797512
     return Blueprint('v1_resources', __name__)
 
-def cache_key():
-    url_args = flask_request.args
-    args = "?"
-    args += '&'.join(
-        f"{item[0]}={item[1]}" for item in url_args.items()
-    )
-    if args != "?":
-        return flask_request.base_url+args
-    return flask_request.base_url
-
 class BaseResource(Resource):
     def __init__(self, rest_api_object: RestAPI, **kwargs: Any) -> None:
         super().__init__(**kwargs)
         self.rest_api = rest_api_object
 
+    def dispatch_request(self, *args: Any, **kwargs: Any) -> Response:
+        try:
+            if profiler.should_profile(flask_request):
+                return profiler.profile(
+                    type(self).__name__,
+                    super().dispatch_request,
+                    *args,
+                    **kwargs,
+                )
+            return super().dispatch_request(*args, **kwargs)
+        except Overloaded as e:
+            # flask-restful turns any other exception into a 500, it returns
+            # the response of an HTTPException as it is
+            abort(overloaded_response(e))
+
 class NFTsUserResource(BaseResource):
-    get_schema = NFTsUserSchema()
+    get_schema = GetNFTsUserSchema()
 
-    @cache.cached(timeout=60, key_prefix=cache_key)
     @use_kwargs(get_schema, location='json_and_query_and_view_args')
-    def get(self, chainID: str, address: str) -> Response:
+    def get(self, chainID: str, address: str, format: str) -> Response:  # pylint: disable=redefined-builtin  # noqa: E501
+        if format == 'ndjson':
+            return self.rest_api.getnfts_stream(address, chainID)
+        return self._get_cached(chainID=chainID, address=address)
+
+    @cached(timeout='nfts', namespace=NFTS_CACHE_NAMESPACE, warm=True, upstream=True)
+    def _get_cached(self, chainID: str, address: str) -> Response:
         return self.rest_api.getnfts(address, chainID)
 
+class NFTsUsersResource(BaseResource):
+    post_schema = NFTsUsersSchema()
+
+    @use_kwargs(post_schema, location='json_and_view_args')
+    def post(self, chainID: str, addresses: List[str]) -> Response:
+        return self.rest_api.getnfts_batch(chainID=chainID, addresses=addresses)
+
 class VaultResource(BaseResource):
     get_schema = NFTsUserSchema()
 
-    @cache.cached(timeout=60, key_prefix=cache_key)
     @use_kwargs(get_schema, location='json_and_query_and_view_args')
+    @cached(
+        timeout='vault',
+        tags=lambda chainID, address: [vault_tag(chainID, address)],
+    )
     def get(self, chainID: str, address: str) -> Response:
         return self.rest_api.getVault(address=address, chainID=chainID)
     
@@ -124,12 +151,30 @@ class VaultResource(BaseResource):
             "curator_address": curator_address,
             "nfts": nfts,
         }
-        return self.rest_api.insert_vault(chainID=chainID, vault=vault)        
+        return self.rest_api.submit_vault(chainID=chainID, vault=vault)
+
+class VaultSubmissionResource(BaseResource):
+    get_schema = VaultSubmissionSchema()
+
+    @use_kwargs(get_schema, location='view_args')
+    def get(self, id: str) -> Response:  # pylint: disable=redefined-builtin
+        return self.rest_api.get_vault_submission(id)
 
 class VaultsResource(BaseResource):
     get_schema = GetVaultsSchema()
     
-    @cache.cached(timeout=60, key_prefix=cache_key)
     @use_kwargs(get_schema, location='json_and_query_and_view_args')
+    @cached(
+        timeout='vaults',
+        tags=lambda chainID, **_kwargs: [vaults_tag(chainID)],
+        warm=True,
+    )
     def get(self, chainID: str, page: int, perpage: int) -> Response:
-        return self.rest_api.getVaults(chainID=chainID, page=page, perpage=perpage)
\ No newline at end of file
+        return self.rest_api.getVaults(chainID=chainID, page=page, perpage=perpage)
+
+class VaultsByAddressResource(BaseResource):
+    post_schema = GetVaultsByAddressSchema()
+
+    @use_kwargs(post_schema, location='json_and_view_args')
+    def post(self, chainID: str, addresses: List[str]) -> Response:
+        return self.rest_api.getVaultsByAddress(chainID=chainID, addresses=addresses)
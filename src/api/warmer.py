@@ -0,0 +1,209 @@
+import argparse
+import array
+import hashlib
+import logging
+import os
+import time
+
+import gevent
+
+from flask import Flask
+from typing import Callable, Dict, List, Optional
+
+from src.logging import LogsAdapter
+from src.metrics import CACHE_WARMER_HITS, CACHE_WARMER_REFRESHES
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+# How often the warmer looks for entries about to expire
+WARM_INTERVAL = 5
+# Popularity counts are halved this often so they follow the recent traffic
+DECAY_INTERVAL = 5 * 60
+# An entry must have been requested at least this many times to be refreshed
+MIN_REQUESTS = 2
+
+class CountMinSketch():
+    """Approximate request counts per key in a fixed amount of memory
+
+    Counts are never underestimated; a key may be overestimated by the counts
+    of the keys it collides with, by at most a few per mille of the total.
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self.rows = [array.array('I', [0]) * width for _ in range(depth)]
+
+    def _indexes(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, key: str) -> int:
+        """Count one request of key and return its estimated count"""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < 0xFFFFFFFF:
+                row[index] += 1
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate  # type: ignore  # depth is at least 1
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def decay(self) -> None:
+        for i, row in enumerate(self.rows):
+            self.rows[i] = array.array('I', (count >> 1 for count in row))
+
+class _Entry():
+    __slots__ = ('resource', 'refresh', 'timeout', 'upstream', 'expires', 'warmed')
+
+    def __init__(
+            self,
+            resource: str,
+            refresh: Callable[[], bool],
+            timeout: int,
+            upstream: bool,
+    ) -> None:
+        self.resource = resource
+        self.refresh = refresh
+        self.timeout = timeout
+        self.upstream = upstream
+        self.expires = time.monotonic() + timeout
+        # whether the cached response was written by the warmer
+        self.warmed = False
+
+class CacheWarmer():
+    """Refreshes the most requested cache entries shortly before they expire
+
+    Every lookup of a warmed resource is counted in a count-min sketch. The
+    entries this process cached are tracked, up to a few times ``top``, and
+    every few seconds the ``top`` most requested among them that are about to
+    expire are computed again and cached anew, so popular wallets and vault
+    pages do not go cold. Refreshes that query Covalent are limited to
+    ``budget`` per minute. Expiry is only known for the entries written by
+    this process.
+    """
+
+    def __init__(self) -> None:
+        self.top = 0
+        self.budget = 0
+        self.sketch = CountMinSketch()
+        self.entries: Dict[str, _Entry] = {}
+        self.app: Optional[Flask] = None
+        self._tokens = 0.0
+        self._last_fill = time.monotonic()
+        self._last_decay = time.monotonic()
+        self._pid: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.top > 0
+
+    def configure(self, app: Flask, args: argparse.Namespace) -> None:
+        self.app = app
+        self.top = args.cache_warm_top
+        self.budget = args.cache_warm_budget
+        self._tokens = float(self.budget)
+        if self.enabled:
+            log.info('Cache warmer enabled', top=self.top, budget=self.budget)
+
+    def record(self, key: str, hit: bool) -> None:
+        """Count a lookup of key, made from a request"""
+        self._ensure_running()
+        self.sketch.add(key)
+        entry = self.entries.get(key)
+        if hit and entry is not None and entry.warmed:
+            CACHE_WARMER_HITS.inc(entry.resource)
+
+    def track(
+            self,
+            key: str,
+            resource: str,
+            refresh: Callable[[], bool],
+            timeout: int,
+            upstream: bool,
+    ) -> None:
+        """Start tracking the entry of key, just cached by a request
+
+        ``refresh`` computes and caches the entry again, returning whether it
+        did. ``upstream`` tells if doing that queries Covalent.
+        """
+        self.entries[key] = _Entry(resource=resource, refresh=refresh, timeout=timeout, upstream=upstream)
+        if len(self.entries) > 4 * self.top:
+            self._trim()
+
+    def _trim(self) -> None:
+        """Keep only the twice ``top`` most requested entries"""
+        keys = sorted(self.entries, key=self.sketch.estimate, reverse=True)
+        for key in keys[2 * self.top:]:
+            del self.entries[key]
+
+    def _ensure_running(self) -> None:
+        # Each forked worker runs its own warmer greenlet over its own entries
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            gevent.spawn(self._run)
+
+    def _run(self) -> None:
+        while True:
+            gevent.sleep(WARM_INTERVAL)
+            try:
+                self.warm()
+            except Exception:  # pylint: disable=broad-except
+                log.error('Cache warmer failed', exc_info=True)
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(float(self.budget), self._tokens + (now - self._last_fill) * self.budget / 60)
+        self._last_fill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def warm(self) -> None:
+        """Refresh the most requested entries that expire before the next rounds"""
+        now = time.monotonic()
+        if now - self._last_decay >= DECAY_INTERVAL:
+            self.sketch.decay()
+            self._last_decay = now
+
+        popular = sorted(
+            ((self.sketch.estimate(key), key) for key in self.entries),
+            reverse=True,
+        )[:self.top]
+        for count, key in popular:
+            # refreshes yield, track() may have trimmed the entry meanwhile
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            lead = max(2 * WARM_INTERVAL, entry.timeout / 5)
+            if count < MIN_REQUESTS or entry.expires - time.monotonic() > lead:
+                continue
+            if entry.upstream and not self._take_token():
+                CACHE_WARMER_REFRESHES.inc(entry.resource, 'over_budget')
+                continue
+            self._refresh(key, entry)
+
+    def _refresh(self, key: str, entry: _Entry) -> None:
+        try:
+            with self.app.app_context():  # type: ignore  # set in configure
+                refreshed = entry.refresh()
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning('Could not refresh cache entry', key=key, error=str(e))
+            refreshed = False
+
+        if not refreshed:
+            CACHE_WARMER_REFRESHES.inc(entry.resource, 'error')
+            # retried when it expires and a request caches it again
+            self.entries.pop(key, None)
+            return
+        CACHE_WARMER_REFRESHES.inc(entry.resource, 'ok')
+        entry.expires = time.monotonic() + entry.timeout
+        entry.warmed = True
+
+warmer = CacheWarmer()
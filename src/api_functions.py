@@ -1,21 +1,32 @@
 import json
 import logging
-import os
-import requests
-
-from datauri import DataURI
-from ethlite.Contracts import Contract
-from json.decoder import JSONDecodeError
-from html.parser import HTMLParser
-from queue import Queue
-from threading import Thread
-from typing import Any, Dict, List, Optional
-
-from src.api.app import db
-from src.constants.constants import NETWORK_RPC, VAULT_FACTORY_ADDRESS
-from src.database.Model import db_insert, db_query_filter, db_query_filter_pag, Vault
+import math
+import time
+import uuid
+
+from sqlalchemy import and_
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.constants.constants import VAULT_FACTORY_ADDRESS
+from src.database.Model import (
+    SUBMISSION_CREATED,
+    SUBMISSION_FAILED,
+    SUBMISSION_PENDING,
+    SUBMISSION_REJECTED,
+    SUBMISSION_VERIFYING,
+    db_insert,
+    db_insert_submission,
+    db_query_active_submission,
+    db_query_filter,
+    db_update_submission,
+    Vault,
+    VaultSubmission,
+)
+from src.database.vault_index import VaultRecord, vault_index
+from src.externalApis.admission import Overloaded
 from src.externalApis.covalent import Covalent
 from src.logging import configure_logging, LogsAdapter
+from src.tracing import span
 from src.typing import ChecksumAVAXAddress
 
 logger = logging.getLogger(__name__)
@@ -26,24 +37,21 @@ class Api_functions():
         self.args = args
         configure_logging(args)
 
-    def get_nfts_user(self, address: ChecksumAVAXAddress, chainID: str = "43114") -> Dict[str, Any]:
-        result = None
-        covalent = Covalent(chainID)
-        result = covalent.get_nft_balances_address(address)
-
-        if (result is None or len(result) == 0):
-            return {"address": address, "chainID": chainID, "items": []}
-
-        items = []
-        for nft in result:
+    @staticmethod
+    def _normalize_nfts(balances: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Turn covalent balances_v2 items into the nfts returned by the api, one by one"""
+        for nft in balances:
             if (int(nft["balance"]) > 0 and ("nft_data" in nft)):
                 for nftdata in nft["nft_data"]:
                     image = ""
                     if ("token_url" in nftdata) and nftdata["token_url"].startswith("data:"):
+                        # only inline token urls need it, most nfts point to ipfs or http
+                        from datauri import DataURI
                         try:
                             uri = DataURI(nftdata["token_url"])
                             if (uri.mimetype.startswith("image")):
-                                image = uri.data
+                                # the data uri is itself the url of the image, uri.data is bytes
+                                image = nftdata["token_url"]
                             elif (uri.mimetype.startswith("application/json")):
                                 json_dict = json.loads(uri.data)
                                 if ("image" in json_dict):
@@ -53,30 +61,55 @@ class Api_functions():
                     elif ("external_data" in nftdata) and ("image" in nftdata["external_data"]):
                         image = nftdata["external_data"]["image"]
                     try:
-                        items.append({
+                        item = {
                             "address": nft["contract_address"],
                             "name": nft["contract_name"],
                             "symbol": nft["contract_ticker_symbol"],
                             "tokenId": nftdata["token_id"],
                             "ImageURL": image,
                             "URI": nftdata["token_url"],
-                        })
+                        }
                     except:
                         continue
+                    yield item
+
+    def get_nfts_user(self, address: ChecksumAVAXAddress, chainID: str = "43114") -> Dict[str, Any]:
+        result = None
+        covalent = Covalent(chainID)
+        result = covalent.get_nft_balances_address(address)
+
+        if (result is None or len(result) == 0):
+            return {"address": address, "chainID": chainID, "items": []}
+
+        with span('normalization', balances=len(result)):
+            items = list(self._normalize_nfts(result))
         return {"address": address, "chainID": int(chainID), "items": items}
 
+    def iter_nfts_user(self, address: ChecksumAVAXAddress, chainID: str = "43114") -> Iterator[Dict[str, Any]]:
+        """Like get_nfts_user, but yields the nfts as covalent pages come in
+
+        Follows the covalent pagination, so it returns all the nfts of the
+        address while only holding one page in memory.
+        """
+        covalent = Covalent(chainID)
+        return self._normalize_nfts(covalent.iter_nft_balances_address(address))
+
     def getVaults(self, chainID: str = "43114", page: int = 1, perpage: int = 15):
-        vaults = db_query_filter_pag(Vault, Vault.chainId==chainID, page, perpage)
-        list_vaults = list(map(lambda item: item.deserialize(), vaults.items))
+        # the same corrections as paginate(error_out=False), pages come from the vault index
+        page = max(page, 1)
+        if perpage < 0:
+            perpage = 20
+        records, total = vault_index.page(chainID, page, perpage)
+        pages = 0 if perpage == 0 else math.ceil(total / perpage)
         return {
             "chainId": int(chainID),
-            "vaults": list_vaults,
+            "vaults": [record.deserialize() for record in records],
             "pagination": {
-                "has_next": vaults.has_next,
-                "has_prev": vaults.has_prev,
-                "page": vaults.page,
-                "per_page": vaults.per_page,
-                "total": vaults.total
+                "has_next": page < pages,
+                "has_prev": page > 1,
+                "page": page,
+                "per_page": perpage,
+                "total": total
             }
         }
 
@@ -90,13 +123,13 @@ class Api_functions():
         Returns:
             Optional[Vault]: return Vault if exist else return None
         """
-        vault = db_query_filter(Vault, Vault.contract_address==address and Vault.chainId==chainID)
+        vault = db_query_filter(Vault, and_(Vault.chainId==int(chainID), Vault.contract_address==address))
         if len(vault) != 1:
             return None
         return vault[0]
 
     def getVault(self, address: ChecksumAVAXAddress, chainID: str = "43114"):
-        vault = self.query_vault(address, chainID)
+        vault = vault_index.get(chainID, address)
         if vault:
             return {
                 "chainId": int(chainID),
@@ -107,6 +140,22 @@ class Api_functions():
             "vault": {},
         } 
 
+    def getVaultsByAddress(
+            self,
+            addresses: List[ChecksumAVAXAddress],
+            chainID: str = "43114",
+    ) -> Dict[str, Any]:
+        """Get many vaults by address from the vault index
+
+        Returns:
+            Dict[str, Any]: the vaults in the order of addresses, None for the ones not found
+        """
+        vaults = vault_index.get_many(chainID, addresses)
+        return {
+            "chainId": int(chainID),
+            "vaults": [vault.deserialize() if vault else None for vault in vaults],
+        }
+
     def insertVault(self, vault: Dict[str, Any], chainID: str = "43114") -> bool:
         covalent = Covalent(chainID)
 
@@ -123,7 +172,7 @@ class Api_functions():
         if (len(result) != 1):
             return False, "Vault not exist!"
         
-        log.debug("Insert new vault: "+str(vault))
+        log.debug('Insert new vault', chain=chainID, vault=vault)
         try:
             vault_object = Vault(
                 name = vault["name"], 
@@ -138,8 +187,76 @@ class Api_functions():
                 nfts = json.dumps(vault["nfts"]),
                 chainId = int(chainID),
             )
+            # built before the insert, the commit expires the object's columns
+            record = VaultRecord(vault_object)
             db_insert(vault_object)
         except Exception as e:
-            log.warning(f"Error in insert vault: {e}")
+            log.warning('Error in insert vault', chain=chainID, error=str(e))
             return False, "Error"
+
+        vault_index.insert(chainID, record)
         return True, "Created"
+
+    def submitVault(self, vault: Dict[str, Any], chainID: str = "43114") -> Tuple[Optional[Dict[str, Any]], str]:
+        """Save a vault submission to be verified and inserted in the background
+
+        Returns the submission, or None and the reason it was not accepted. A
+        vault already being processed returns that submission instead of a
+        new one.
+        """
+        if self.query_vault(vault["contract_address"], chainID):
+            return None, "Vault already exist in the db!"
+        active = db_query_active_submission(int(chainID), vault["contract_address"])
+        if active is not None:
+            return active.deserialize(), "Already submitted"
+
+        now = time.time()
+        submission = VaultSubmission(
+            id = uuid.uuid4().hex,
+            chainId = int(chainID),
+            contract_address = vault["contract_address"],
+            vault = json.dumps(vault),
+            status = SUBMISSION_PENDING,
+            message = "",
+            created_at = now,
+            updated_at = now,
+        )
+        # read before the insert, the commit expires the object's columns
+        result = submission.deserialize()
+        if not db_insert_submission(submission):
+            # submitted by another request since the query above
+            active = db_query_active_submission(int(chainID), vault["contract_address"])
+            if active is None:
+                # it finished in between, the vault exists or was rejected
+                return None, "Vault submission just finished, check the vault"
+            return active.deserialize(), "Already submitted"
+
+        log.debug('New vault submission', chain=chainID, id=result["id"])
+        return result, "Accepted"
+
+    def getVaultSubmission(self, submission_id: str) -> Optional[Dict[str, Any]]:
+        submissions = db_query_filter(VaultSubmission, VaultSubmission.id==submission_id)
+        if len(submissions) != 1:
+            return None
+        return submissions[0].deserialize()
+
+    def processVaultSubmission(self, submission: VaultSubmission) -> None:
+        """Verify a claimed submission on chain and insert its vault
+
+        May raise:
+        - Overloaded if Covalent had no room, the submission is pending again
+        """
+        chainID = str(submission.chainId)
+        try:
+            success, message = self.insertVault(json.loads(submission.vault), chainID)
+        except Overloaded as e:
+            # claimed again once upstream has room, the caller should wait a bit
+            db_update_submission(submission.id, SUBMISSION_PENDING, str(e))
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning('Vault submission failed', chain=chainID, id=submission.id, error=str(e))
+            db_update_submission(submission.id, SUBMISSION_FAILED, "Error")
+            return
+
+        status = SUBMISSION_CREATED if success else SUBMISSION_REJECTED
+        db_update_submission(submission.id, status, message)
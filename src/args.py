@@ -1,4 +1,5 @@
 import argparse
+import os
 
 from typing import Any, List, Sequence, Union
 
@@ -34,6 +35,169 @@ def app_args(prog: str, description: str) -> argparse.ArgumentParser:
         type=int,
         default=6411,
     )
+    p.add_argument(
+        '--workers',
+        help=(
+            'The number of worker processes serving the rest API. With more '
+            'than one, workers are forked sharing the listening socket'
+        ),
+        type=int,
+        default=1,
+    )
+    p.add_argument(
+        '--blocking-io',
+        help=(
+            'Do not monkey patch the stdlib with gevent. Upstream and database '
+            'calls will then block the whole process while they run. Only '
+            'with a single worker'
+        ),
+        action='store_true',
+    )
+    p.add_argument(
+        '--json-encoder',
+        help='The JSON encoder of the responses. auto picks orjson if installed',
+        choices=['auto', 'json', 'orjson'],
+        default='auto',
+    )
+    p.add_argument(
+        '--cache-type',
+        help=(
+            'The cache backend. memory is per process and bounded in bytes, '
+            'filesystem and redis are shared between processes'
+        ),
+        choices=['memory', 'filesystem', 'redis'],
+        default='memory',
+    )
+    p.add_argument(
+        '--cache-max-bytes',
+        help='The maximum size in bytes of the memory cache',
+        type=int,
+        default=256 * 1024 * 1024,
+    )
+    p.add_argument(
+        '--cache-dir',
+        help='The directory of the filesystem cache. Defaults to one in the temp dir',
+        default=None,
+    )
+    p.add_argument(
+        '--cache-threshold',
+        help='The maximum number of entries of the filesystem cache',
+        type=int,
+        default=5000,
+    )
+    p.add_argument(
+        '--cache-redis-url',
+        help='The url of the redis server used by the redis cache',
+        default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    )
+    p.add_argument(
+        '--cache-timeout-nfts',
+        help='Seconds a getNftsUser response is cached',
+        type=int,
+        default=60,
+    )
+    p.add_argument(
+        '--cache-timeout-vault',
+        help=(
+            'Seconds a vault response is cached. Inserts invalidate it. Defaults to 6 '
+            'hours, or 60 seconds with several workers sharing no cache backend'
+        ),
+        type=int,
+        default=None,
+    )
+    p.add_argument(
+        '--cache-timeout-vaults',
+        help=(
+            'Seconds a vaults page is cached. Inserts invalidate it. Defaults to 6 '
+            'hours, or 60 seconds with several workers sharing no cache backend'
+        ),
+        type=int,
+        default=None,
+    )
+    p.add_argument(
+        '--cache-stale-ttl',
+        help=(
+            'Seconds successful responses are kept after they expire, to be served '
+            'while upstream is overloaded'
+        ),
+        type=int,
+        default=10 * 60,
+    )
+    p.add_argument(
+        '--upstream-concurrency',
+        help='Most Covalent queries running at once for each chain and module',
+        type=int,
+        default=16,
+    )
+    p.add_argument(
+        '--upstream-queue',
+        help=(
+            'Most Covalent queries waiting for a slot for each chain and module. '
+            'Requests beyond that get a 503'
+        ),
+        type=int,
+        default=32,
+    )
+    p.add_argument(
+        '--upstream-max-wait',
+        help='Seconds a request may wait in total for Covalent slots before it gets a 503',
+        type=float,
+        default=5.0,
+    )
+    p.add_argument(
+        '--cache-warm-top',
+        help=(
+            'Keep this many of the most requested getNftsUser and vaults entries '
+            'warm, refreshing them shortly before they expire. 0 disables the warmer'
+        ),
+        type=int,
+        default=0,
+    )
+    p.add_argument(
+        '--cache-warm-budget',
+        help='Most refreshes per minute the cache warmer makes that query Covalent',
+        type=int,
+        default=30,
+    )
+    p.add_argument(
+        '--vault-workers',
+        help='Greenlets per process verifying and inserting the submitted vaults',
+        type=int,
+        default=2,
+    )
+    p.add_argument(
+        '--profiling',
+        help=(
+            'Enable request profiling. Requests with the X-Profile header, or '
+            'sampled with --profile-sample-rate, are profiled'
+        ),
+        action='store_true',
+    )
+    p.add_argument(
+        '--profile-dir',
+        help='The directory where the request profiles are saved as pstats files',
+        default='profiles',
+    )
+    p.add_argument(
+        '--profile-sample-rate',
+        help='The fraction of requests profiled when profiling is enabled',
+        type=float,
+        default=0.0,
+    )
+    p.add_argument(
+        '--profile-max-files',
+        help='How many request profiles are kept, the oldest are removed',
+        type=int,
+        default=100,
+    )
+    p.add_argument(
+        '--trace-export',
+        help=(
+            'Where to export the request traces as OTLP/JSON: a file to append '
+            'them to, or the OTLP/HTTP url of a collector. Not exported by default'
+        ),
+        default=None,
+    )
     p.add_argument(
         '--logfile',
         help='The name of the file to write log entries to',
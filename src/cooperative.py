@@ -0,0 +1,28 @@
+import sys
+
+from typing import List, Optional
+
+BLOCKING_IO_ARG = '--blocking-io'
+
+def patch_all(argv: Optional[List[str]] = None) -> bool:
+    """Monkey patch the stdlib with gevent so blocking I/O yields to other greenlets
+
+    Has to run before anything else is imported, which is before the
+    arguments are parsed, so the opt out flag is looked up in argv directly.
+    Returns whether the patching was done.
+    """
+    argv = sys.argv if argv is None else argv
+    if BLOCKING_IO_ARG in argv:
+        return False
+
+    from gevent import monkey
+    monkey.patch_all()
+    return True
+
+def is_cooperative() -> bool:
+    """Whether patch_all() ran, and so blocking calls must be kept off the hub"""
+    if 'gevent.monkey' not in sys.modules:
+        return False
+
+    from gevent import monkey
+    return monkey.is_module_patched('socket')
@@ -1,8 +1,18 @@
+import contextvars
 import json
+import time
 
-from typing import Any, Dict, List
+import gevent
+from flask import Flask, current_app
+from sqlalchemy import and_, event, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Callable, Dict, List, Optional
 
 from src.api.app import db
+from src.cooperative import is_cooperative
+from src.metrics import DB_QUERY_LATENCY
+from src.tracing import start_span
 
 class Vault(db.Model):
     __tablename__ = 'vaults'
@@ -18,6 +28,10 @@ class Vault(db.Model):
     nfts = db.Column(db.String(), nullable=False)
     chainId = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_vaults_chainId_contract_address', 'chainId', 'contract_address'),
+    )
+
     def __repr__(self):
         return f'<Vault {self.name}-{self.id}>'
 
@@ -35,12 +49,191 @@ class Vault(db.Model):
             "nfts": json.loads(self.nfts),
         }
 
-def db_insert(obj: object) -> None:
+SUBMISSION_PENDING = 'pending'
+SUBMISSION_VERIFYING = 'verifying'
+SUBMISSION_CREATED = 'created'
+SUBMISSION_REJECTED = 'rejected'
+SUBMISSION_FAILED = 'failed'
+
+class VaultSubmission(db.Model):
+    """A vault POST waiting for, or done with, its on-chain verification"""
+    __tablename__ = 'vault_submissions'
+    id = db.Column(db.String(), primary_key=True)
+    chainId = db.Column(db.Integer, nullable=False)
+    contract_address = db.Column(db.String(), nullable=False)
+    vault = db.Column(db.String(), nullable=False)
+    status = db.Column(db.String(), nullable=False)
+    message = db.Column(db.String(), nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        # At most one submission of a vault is being processed at a time
+        db.Index(
+            'ux_vault_submissions_active',
+            'chainId',
+            'contract_address',
+            unique=True,
+            sqlite_where=text(f"status IN ('{SUBMISSION_PENDING}', '{SUBMISSION_VERIFYING}')"),
+        ),
+        db.Index('ix_vault_submissions_status', 'status', 'updated_at'),
+    )
+
+    def deserialize(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "chainId": self.chainId,
+            "contract_address": self.contract_address,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # pylint: disable=unused-argument  # noqa: E501
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+    conn.info.setdefault('query_span', []).append(
+        start_span('db.query', statement=statement.split(None, 1)[0].upper()),
+    )
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # pylint: disable=unused-argument  # noqa: E501
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    DB_QUERY_LATENCY.observe(elapsed, statement.split(None, 1)[0].upper())
+    query_span = conn.info['query_span'].pop()
+    if query_span is not None:
+        query_span.finish()
+
+def init_database(app: Flask) -> None:
+    """Create the tables and indexes missing in an existing database"""
+    with app.app_context():
+        VaultSubmission.__table__.create(bind=db.engine, checkfirst=True)
+        for index in Vault.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def _run_cooperative(func: Callable, *args: Any) -> Any:
+    """Run a database call without blocking the gevent hub
+
+    sqlite3 is a C extension that monkey patching can't make cooperative, so
+    in cooperative mode the call runs in the hub threadpool. The worker thread
+    gets its own app context and session, removed when the call ends; the
+    objects returned are detached but have their columns loaded. It runs in
+    a copy of the caller's context so its queries join the request trace.
+    """
+    if not is_cooperative():
+        return func(*args)
+
+    app = current_app._get_current_object()
+    context = contextvars.copy_context()
+
+    def run_in_thread() -> Any:
+        with app.app_context():
+            try:
+                return func(*args)
+            finally:
+                db.session.remove()
+
+    return gevent.get_hub().threadpool.apply(context.run, (run_in_thread,))
+
+def _db_insert(obj: object) -> None:
     db.session.add(obj)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _db_insert_submission(submission: VaultSubmission) -> bool:
+    """Insert a submission, False if one of the same vault is already active"""
+    db.session.add(submission)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # caught here, an exception leaving the threadpool gets its traceback printed by gevent
+        db.session.rollback()
+        return False
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
+
+def _db_query_active_submission(chainId: int, contract_address: str) -> Optional[VaultSubmission]:
+    return db.session.query(VaultSubmission).filter(
+        VaultSubmission.chainId == chainId,
+        VaultSubmission.contract_address == contract_address,
+        VaultSubmission.status.in_([SUBMISSION_PENDING, SUBMISSION_VERIFYING]),
+    ).one_or_none()
+
+def _db_query_filter(obj: object, expression: bool) -> List[object]:
+    return db.session.query(obj).filter(expression).all()
+
+def _db_query_filter_pag(obj: object, expression: bool, page: int, per_page: int) -> List[object]:
+    return db.session.query(obj).filter(expression).paginate(page, per_page, error_out=False)
+
+def _db_query_vaults(chainId: Optional[int]) -> List[Vault]:
+    query = db.session.query(Vault)
+    if chainId is not None:
+        query = query.filter(Vault.chainId == chainId)
+    # the order of the inserts, the one /vaults always paged in
+    return query.order_by(text('vaults.rowid')).all()
+
+def _db_claim_submission(stale_before: float) -> Optional[VaultSubmission]:
+    """Mark the oldest claimable submission as verifying and return it
+
+    Pending submissions are claimable, and so are the ones left verifying
+    since before ``stale_before`` by a process that died. The update only
+    succeeds for one of the processes racing on a submission.
+    """
+    claimable = or_(
+        VaultSubmission.status == SUBMISSION_PENDING,
+        and_(VaultSubmission.status == SUBMISSION_VERIFYING, VaultSubmission.updated_at < stale_before),
+    )
+    while True:
+        submission = db.session.query(VaultSubmission).filter(claimable).order_by(VaultSubmission.created_at).first()
+        if submission is None:
+            return None
+        claimed = db.session.query(VaultSubmission).filter(
+            VaultSubmission.id == submission.id,
+            claimable,
+        ).update(
+            {'status': SUBMISSION_VERIFYING, 'updated_at': time.time()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if claimed == 1:
+            db.session.refresh(submission)
+            return submission
+
+def _db_update_submission(submission_id: str, status: str, message: str) -> None:
+    db.session.query(VaultSubmission).filter(VaultSubmission.id == submission_id).update(
+        {'status': status, 'message': message, 'updated_at': time.time()},
+        synchronize_session=False,
+    )
     db.session.commit()
 
+def db_insert(obj: object) -> None:
+    _run_cooperative(_db_insert, obj)
+
+def db_insert_submission(submission: VaultSubmission) -> bool:
+    return _run_cooperative(_db_insert_submission, submission)
+
+def db_query_active_submission(chainId: int, contract_address: str) -> Optional[VaultSubmission]:
+    """The submission of a vault being processed, if any"""
+    return _run_cooperative(_db_query_active_submission, chainId, contract_address)
+
 def db_query_filter(obj: object, expression: bool) -> List[object]:
-    return db.session.query(obj).filter(expression).all()
+    return _run_cooperative(_db_query_filter, obj, expression)
 
 def db_query_filter_pag(obj: object, expression: bool, page: int, per_page: int) -> List[object]:
-    return db.session.query(obj).filter(expression).paginate(page, per_page, error_out=False)
+    return _run_cooperative(_db_query_filter_pag, obj, expression, page, per_page)
+
+def db_query_vaults(chainId: Optional[int] = None) -> List[Vault]:
+    """All the vaults of a chain, or of every chain, ordered like the pages of /vaults"""
+    return _run_cooperative(_db_query_vaults, chainId)
+
+def db_claim_submission(stale_before: float) -> Optional[VaultSubmission]:
+    return _run_cooperative(_db_claim_submission, stale_before)
+
+def db_update_submission(submission_id: str, status: str, message: str) -> None:
+    _run_cooperative(_db_update_submission, submission_id, status, message)
@@ -0,0 +1,156 @@
+import json
+import logging
+import time
+
+from flask import Flask
+from gevent.lock import BoundedSemaphore
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.api.cache import CACHE_TIMEOUTS, invalidate_vault, tag_versions, vaults_tag
+from src.database.Model import Vault, db_query_vaults
+from src.logging import LogsAdapter
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+class VaultRecord():
+    """The columns of a vault row, with its nfts already parsed"""
+    __slots__ = (
+        'name',
+        'symbol',
+        'supply',
+        'price',
+        'fee',
+        'contract_address',
+        'curator_address',
+        'description',
+        'verified',
+        'nfts',
+    )
+
+    def __init__(self, vault: Vault) -> None:
+        self.name = vault.name
+        self.symbol = vault.symbol
+        self.supply = vault.supply
+        self.price = vault.price
+        self.fee = vault.fee
+        self.contract_address = vault.contract_address
+        self.curator_address = vault.curator_address
+        self.description = vault.description
+        self.verified = vault.verified != 0
+        self.nfts = json.loads(vault.nfts)
+
+    def deserialize(self) -> Dict[str, Any]:
+        """The same dict as Vault.deserialize"""
+        return {
+            "name": self.name,
+            "symbol": self.symbol,
+            "supply": self.supply,
+            "price": self.price,
+            "fee": self.fee,
+            "contract_address": self.contract_address,
+            "curator_address": self.curator_address,
+            "description": self.description,
+            "verified": self.verified,
+            "nfts": self.nfts,
+        }
+
+class _ChainVaults():
+    __slots__ = ('by_address', 'records', 'version', 'loaded_at')
+
+    def __init__(self, records: List[VaultRecord], version: str) -> None:
+        # records are in insertion order, the order of the /vaults pages
+        self.records = records
+        self.by_address = {record.contract_address: record for record in records}
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def insert(self, record: VaultRecord) -> None:
+        if record.contract_address in self.by_address:
+            return
+        self.records.append(record)
+        self.by_address[record.contract_address] = record
+
+class VaultIndex():
+    """The vaults of each chain in memory, so the read endpoints don't query the database
+
+    A chain is loaded from the vaults table on its first read, or for all of
+    them at startup, and kept in step by the inserts of this process. A chain
+    is loaded again when the version of its vaults cache tag changed, which
+    is how the inserts of other processes show up with a shared cache
+    backend, and at the latest after the timeout of the /vaults pages, so it
+    is never staler than a cached page.
+    """
+
+    def __init__(self) -> None:
+        self.chains: Dict[int, _ChainVaults] = {}
+        self._locks: Dict[int, BoundedSemaphore] = {}
+
+    def load(self, app: Flask) -> None:
+        """Load the vaults of every chain"""
+        with app.app_context():
+            rows = db_query_vaults()
+            by_chain: Dict[int, List[VaultRecord]] = {}
+            for row in rows:
+                by_chain.setdefault(row.chainId, []).append(VaultRecord(row))
+            for chainId, records in by_chain.items():
+                version = tag_versions([vaults_tag(str(chainId))])[0]
+                self.chains[chainId] = _ChainVaults(records, version)
+        log.info('Vault index loaded', chains=len(by_chain), vaults=len(rows))
+
+    def _is_fresh(self, chain: _ChainVaults, version: str) -> bool:
+        return chain.version == version and time.monotonic() - chain.loaded_at < CACHE_TIMEOUTS['vaults']
+
+    def _chain(self, chainID: str) -> _ChainVaults:
+        chainId = int(chainID)
+        version = tag_versions([vaults_tag(chainID)])[0]
+        chain = self.chains.get(chainId)
+        if chain is not None and self._is_fresh(chain, version):
+            return chain
+
+        lock = self._locks.setdefault(chainId, BoundedSemaphore())
+        with lock:
+            # loaded by another greenlet while this one waited
+            chain = self.chains.get(chainId)
+            if chain is not None and self._is_fresh(chain, version):
+                return chain
+            with span('vault_index.load', chain=chainID):
+                records = [VaultRecord(row) for row in db_query_vaults(chainId)]
+            chain = _ChainVaults(records, version)
+            self.chains[chainId] = chain
+            log.debug('Vault index chain loaded', chain=chainID, vaults=len(records))
+            return chain
+
+    def get(self, chainID: str, address: str) -> Optional[VaultRecord]:
+        return self._chain(chainID).by_address.get(address)
+
+    def get_many(self, chainID: str, addresses: Iterable[str]) -> List[Optional[VaultRecord]]:
+        by_address = self._chain(chainID).by_address
+        return [by_address.get(address) for address in addresses]
+
+    def page(self, chainID: str, page: int, per_page: int) -> Tuple[List[VaultRecord], int]:
+        """The records of a page and the total, paged like flask-sqlalchemy's paginate"""
+        records = self._chain(chainID).records
+        start = (page - 1) * per_page
+        return records[start:start + per_page], len(records)
+
+    def insert(self, chainID: str, record: VaultRecord) -> None:
+        """Add a vault just inserted in the database and purge the cached responses missing it
+
+        The chain keeps its records only if it was up to date with the
+        version of its tag before this insert; otherwise it has missed
+        another change and is loaded again on its next read.
+        """
+        previous = tag_versions([vaults_tag(chainID)])[0]
+        invalidate_vault(chainID, record.contract_address)
+        chain = self.chains.get(int(chainID))
+        if chain is None:
+            return
+        if chain.version != previous:
+            del self.chains[int(chainID)]
+            return
+        chain.insert(record)
+        chain.version = tag_versions([vaults_tag(chainID)])[0]
+
+vault_index = VaultIndex()
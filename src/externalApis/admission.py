@@ -0,0 +1,119 @@
+import argparse
+import logging
+import math
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from gevent.lock import BoundedSemaphore
+from typing import Dict, Iterator, Optional, Tuple
+
+from src.logging import LogsAdapter
+from src.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_QUEUE_DEPTH, UPSTREAM_SHED
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+class Overloaded(Exception):
+    """An upstream query was not admitted: too many queued already or its deadline passed"""
+
+    def __init__(self, chain: str, module: str, retry_after: int) -> None:
+        super().__init__(f'Too many requests to {module} of chain {chain}, retry after {retry_after}s')
+        self.chain = chain
+        self.module = module
+        self.retry_after = retry_after
+
+# When the current request stops waiting for upstream slots, as time.monotonic()
+_deadline: ContextVar[Optional[float]] = ContextVar('upstream_deadline', default=None)
+
+class _Limit():
+    __slots__ = ('semaphore', 'waiting')
+
+    def __init__(self, concurrency: int) -> None:
+        self.semaphore = BoundedSemaphore(concurrency)
+        self.waiting = 0
+
+class AdmissionController():
+    """Bounds the queries in flight to each upstream module of each chain
+
+    At most ``concurrency`` queries run at once per chain and module, and at
+    most ``queue`` more wait for a slot. A query that finds the queue full, or
+    that would wait past the deadline of its request, is shed with Overloaded
+    instead of piling up greenlets (and their memory) behind a slow upstream.
+    """
+
+    def __init__(self) -> None:
+        self.concurrency = 16
+        self.queue = 32
+        self.max_wait = 5.0
+        self.limits: Dict[Tuple[str, str], _Limit] = {}
+
+    def configure(self, args: argparse.Namespace) -> None:
+        self.concurrency = args.upstream_concurrency
+        self.queue = args.upstream_queue
+        self.max_wait = args.upstream_max_wait
+        self.limits = {}
+        log.info(
+            'Upstream admission control',
+            concurrency=self.concurrency,
+            queue=self.queue,
+            max_wait=self.max_wait,
+        )
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.max_wait))
+
+    def start_deadline(self) -> None:
+        """Start the time the current request may spend waiting for upstream slots"""
+        _deadline.set(time.monotonic() + self.max_wait)
+
+    def _limit(self, chain: str, module: str) -> _Limit:
+        limit = self.limits.get((chain, module))
+        if limit is None:
+            limit = _Limit(self.concurrency)
+            self.limits[(chain, module)] = limit
+        return limit
+
+    def _shed(self, chain: str, module: str, reason: str) -> Overloaded:
+        UPSTREAM_SHED.inc(chain, module, reason)
+        log.warning('Upstream query shed', chain=chain, module=module, reason=reason)
+        return Overloaded(chain, module, self.retry_after)
+
+    @contextmanager
+    def admit(self, chain: str, module: str) -> Iterator[None]:
+        """Hold a slot for an upstream query while in the block
+
+        May raise:
+        - Overloaded if the query was not admitted
+        """
+        limit = self._limit(chain, module)
+        if limit.semaphore.locked():
+            if limit.waiting >= self.queue:
+                raise self._shed(chain, module, 'queue_full')
+
+            deadline = _deadline.get()
+            wait = self.max_wait if deadline is None else deadline - time.monotonic()
+            if wait <= 0:
+                raise self._shed(chain, module, 'deadline')
+
+            limit.waiting += 1
+            UPSTREAM_QUEUE_DEPTH.inc(chain, module)
+            try:
+                admitted = limit.semaphore.acquire(timeout=wait)
+            finally:
+                limit.waiting -= 1
+                UPSTREAM_QUEUE_DEPTH.dec(chain, module)
+            if not admitted:
+                raise self._shed(chain, module, 'deadline')
+        else:
+            limit.semaphore.acquire()
+
+        UPSTREAM_IN_FLIGHT.inc(chain, module)
+        try:
+            yield
+        finally:
+            UPSTREAM_IN_FLIGHT.dec(chain, module)
+            limit.semaphore.release()
+
+admission = AdmissionController()
@@ -1,14 +1,19 @@
 import logging
 import os
+import time
 
 from json.decoder import JSONDecodeError
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
 
+from src.externalApis.admission import Overloaded, admission
 from src.logging import LogsAdapter
+from src.metrics import COVALENT_LATENCY, COVALENT_REQUESTS
+from src.tracing import SPAN_KIND_CLIENT, Span, start_span
 from src.typing import ChecksumAVAXAddress
 
+COVALENT_API_URL = 'https://api.covalenthq.com/v1'
 CONST_RETRY = 0
 DATE_FORMAT_COVALENT = '%Y-%m-%dT%H:%M:%SZ'
 COVALENT_QUERY_LIMIT = 200
@@ -17,6 +22,9 @@ PAGESIZE = 100
 logger = logging.getLogger(__name__)
 log = LogsAdapter(logger)
 
+class RemoteError(Exception):
+    """Covalent could not be reached or returned an unexpected response"""
+
 class Covalent():
     def __init__(
             self,
@@ -26,6 +34,19 @@ class Covalent():
         self.session.headers.update({'User-Agent': 'rotkehlchen'})
         self.chain_id = chain_id
 
+    def _record_query(
+            self,
+            module: str,
+            start: float,
+            status: str,
+            query_span: Optional[Span],
+    ) -> None:
+        COVALENT_LATENCY.observe(time.perf_counter() - start, module, self.chain_id)
+        COVALENT_REQUESTS.inc(module, self.chain_id, status)
+        if query_span is not None:
+            query_span.attributes['status'] = status
+            query_span.finish()
+
     def _query(
             self,
             module: str,
@@ -38,8 +59,9 @@ class Covalent():
         May raise:
         - RemoteError if there are any problems with reaching Covalent or if
         an unexpected response is returned
+        - Overloaded if too many queries to this module are running already
         """
-        query_str = f'https://api.covalenthq.com/v1/{self.chain_id}/{action}'
+        query_str = f'{COVALENT_API_URL}/{self.chain_id}/{action}'
         if address:
             query_str += f'/{address}'
         query_str += f'/{module}/'
@@ -54,39 +76,57 @@ class Covalent():
 
         retry = 0
         while retry <= CONST_RETRY:
-            log.debug(f'Querying covalent: {query_str}')
+            log.debug('Querying covalent', module=module, chain=self.chain_id, attempt=retry)
+            start = time.perf_counter()
+            query_span = start_span(
+                'covalent.query',
+                SPAN_KIND_CLIENT,
+                module=module,
+                chain=self.chain_id,
+                attempt=retry,
+            )
             try:
-                response = self.session.get(
-                    query_str, 
-                    timeout= timeout,
-                )
-
+                with admission.admit(self.chain_id, module):
+                    response = self.session.get(
+                        query_str, 
+                        timeout= timeout,
+                    )
+
+            except Overloaded:
+                self._record_query(module, start, 'shed', query_span)
+                raise
             except requests.exceptions.RequestException as e:
+                is_timeout = isinstance(e, requests.exceptions.Timeout)
+                self._record_query(module, start, 'timeout' if is_timeout else 'error', query_span)
                 # In timeout retry
-                if isinstance(e, requests.exceptions.Timeout):
+                if is_timeout:
                     if retry == CONST_RETRY:
                         return None
                     retry += 1
                     continue
-                log.warn(f'Covalent API request failed due to {e}')
+                log.warning('Covalent API request failed', module=module, error=str(e))
                 return None 
 
+            self._record_query(module, start, str(response.status_code), query_span)
+
             try:
                 result = response.json()
             except JSONDecodeError as e:
-                log.warn(
-                    f'Covalent API request {response.url} returned invalid '
-                    f'JSON response: {response.text}'
+                log.warning(
+                    'Covalent API request returned invalid JSON response',
+                    module=module,
+                    text=response.text,
                 )
                 return None
 
             if response.status_code != 200:
                 error_message = result['error_message'] if 'error_message' in result else None
-                log.warn(
-                    f'Covalent API request {response.url} failed '
-                    f'with HTTP status code {response.status_code} and '
-                    f'Error message: {error_message} and text',
-                    f'{response.text}',
+                log.warning(
+                    'Covalent API request failed',
+                    module=module,
+                    status_code=response.status_code,
+                    error_message=error_message,
+                    text=response.text,
                 )
                 return None
 
@@ -114,6 +154,47 @@ class Covalent():
         except:
             return []
 
+    def iter_nft_balances_address(
+            self,
+            address: ChecksumAVAXAddress,
+    ) -> Iterator[Dict[str, Any]]:
+        """Like get_nft_balances_address, but follows the pagination and
+        yields the items one page at a time
+
+        May raise:
+        - RemoteError if a page could not be fetched, so a partial result
+        can be told apart from a complete one
+        - Overloaded if too many queries to this module are running already
+        """
+        page = 0
+        while True:
+            options = {
+                'limit': COVALENT_QUERY_LIMIT,
+                "nft": True,
+                "match": '{type:nft}',
+                'page-size': PAGESIZE,
+                'page-number': page,
+            }
+            result = self._query(
+                module='balances_v2',
+                address=address,
+                action='address',
+                options=options,
+            )
+            if result is None:
+                raise RemoteError(f'Covalent query of nft balances page {page} failed')
+
+            try:
+                items = result["data"]["items"]
+                pagination = result["data"].get("pagination") or {}
+            except (KeyError, TypeError, AttributeError) as e:
+                raise RemoteError(f'Unexpected Covalent nft balances page {page}') from e
+
+            yield from items
+            if not pagination.get("has_more", False):
+                return
+            page += 1
+
     def get_transaction_by_vault_address(
         self,
         address: ChecksumAVAXAddress,
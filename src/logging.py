@@ -1,27 +1,194 @@
 import argparse
 import logging
+import logging.handlers
+import time
 
-from typing import Any, Dict, MutableMapping, Tuple
+from gevent.monkey import get_original
+from typing import Any, Dict, List, MutableMapping, Optional, Tuple
+
+# gevent patches these to cooperate with greenlets; the writer needs the real
+# ones since it is an OS thread that blocks on the queue and on the disk
+_SimpleQueue = get_original('queue', 'SimpleQueue')
+_start_new_thread = get_original('_thread', 'start_new_thread')
+_allocate_lock = get_original('_thread', 'allocate_lock')
+_RLock = get_original('_thread', 'RLock')
+
+# Values longer than this are cut when the message is formatted
+LOG_VALUE_MAX_LENGTH = 1000
+# Records waiting for the writer above which new ones are dropped
+LOG_QUEUE_MAX_SIZE = 10000
+# At most LOG_RATE_LIMIT_BURST warnings with the same message per window
+LOG_RATE_LIMIT_WINDOW = 60
+LOG_RATE_LIMIT_BURST = 10
+
+# Keyword arguments that go to the logger rather than into the message
+_LOGGING_KWARGS = ('exc_info', 'stack_info')
+
+def _truncate(value: Any) -> str:
+    text = str(value)
+    if len(text) <= LOG_VALUE_MAX_LENGTH:
+        return text
+    return f'{text[:LOG_VALUE_MAX_LENGTH]}...({len(text) - LOG_VALUE_MAX_LENGTH} more chars)'
+
+class LazyMessage():
+    """A log message and its kwargs, only joined when a handler formats it"""
+    __slots__ = ('msg', 'kwargs')
+
+    def __init__(self, msg: str, kwargs: Dict[str, Any]) -> None:
+        self.msg = msg
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        return self.msg + ','.join(f' {key}={_truncate(value)}' for key, value in self.kwargs.items())
 
 class LogsAdapter(logging.LoggerAdapter):
 
     def __init__(self, logger: logging.Logger):
         super().__init__(logger, extra={})
 
-    def process(self, msg: str, kwargs: MutableMapping[str, Any]) -> Tuple[str, Dict]:
+    def process(self, msg: str, kwargs: MutableMapping[str, Any]) -> Tuple[Any, Dict]:
         """
         This is the main post-processing function for rotki logs
 
-        This function also appends all kwargs to the final message.
+        This function also appends all kwargs to the final message. That is
+        done lazily, by the log writer, so keep the message a constant and
+        pass the values as kwargs. Those are formatted later and must not be
+        changed after the call.
+        """
+        logging_kwargs = {key: kwargs.pop(key) for key in _LOGGING_KWARGS if key in kwargs}
+        return LazyMessage(msg, dict(kwargs)), logging_kwargs
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most ``burst`` warnings with the same message per window
+
+    The message is the constant part of the log call, so a warning repeated
+    for every failing upstream request counts as one. The first warning of the
+    next window tells how many were suppressed.
+    """
+
+    def __init__(self, window: float = LOG_RATE_LIMIT_WINDOW, burst: int = LOG_RATE_LIMIT_BURST) -> None:
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        # per message: window start, records let through, records suppressed
+        self.counts: Dict[Tuple[str, int, str], List[Any]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+
+        msg = record.msg.msg if isinstance(record.msg, LazyMessage) else str(record.msg)
+        key = (record.name, record.levelno, msg)
+        now = time.monotonic()
+        count = self.counts.get(key)
+        if count is None or now - count[0] >= self.window:
+            suppressed = count[2] if count is not None else 0
+            self.counts[key] = [now, 1, 0]
+            if suppressed != 0:
+                _annotate(record, suppressed=suppressed)
+            return True
+
+        if count[1] < self.burst:
+            count[1] += 1
+            return True
+        count[2] += 1
+        return False
+
+def _annotate(record: logging.LogRecord, **kwargs: Any) -> None:
+    # other message objects, like the exported traces, are left as they are
+    if isinstance(record.msg, LazyMessage):
+        record.msg = LazyMessage(record.msg.msg, {**record.msg.kwargs, **kwargs})
+    elif isinstance(record.msg, str):
+        record.msg = record.msg + ','.join(f' {key}={value}' for key, value in kwargs.items())
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Puts the records in the writer queue as they are, without formatting them
+
+    The stock QueueHandler formats the message in the calling thread, which is
+    the request. Records are dropped while the queue is full.
+    """
+
+    def __init__(self, queue: Any) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= LOG_QUEUE_MAX_SIZE:
+            self.dropped += 1
+            return
+        if self.dropped != 0:
+            _annotate(record, dropped_before=self.dropped)
+            self.dropped = 0
+        self.queue.put_nowait(record)
+
+class LogWriter():
+    """Writes the queued log records to the handlers from a separate OS thread
+
+    Logging from a request is then only putting the record in a queue: the
+    formatting and the disk writes happen in the writer thread, which releases
+    the GIL while it waits on the disk.
+    """
+
+    def __init__(self) -> None:
+        self.queue = _SimpleQueue()
+        self.handler = _QueueHandler(self.queue)
+        self.handler.addFilter(RateLimitFilter())
+        self.handlers: List[logging.Handler] = []
+        self._running: Optional[Any] = None
+
+    def start(self, handlers: List[logging.Handler]) -> None:
+        self.handlers = handlers
+        for handler in handlers:
+            handler.lock = _RLock()
+        self._running = _allocate_lock()
+        self._running.acquire()
+        _start_new_thread(self._write, (self.queue, self._running))
+
+    def _write(self, queue: Any, running: Any) -> None:
+        try:
+            while True:
+                record = queue.get()
+                if record is None:
+                    return
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+        finally:
+            running.release()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Write what is left in the queue and stop the writer thread"""
+        if self._running is None:
+            return
+        self.queue.put(None)
+        if self._running.acquire(timeout=timeout):
+            self._running.release()
+        self._running = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def after_fork(self) -> None:
+        """Start a writer in a forked process, the thread of the parent is not there
+
+        The queue is replaced since the records in the copy inherited from the
+        parent are written by the parent.
         """
-        msg += ','.join(' {}={}'.format(a[0], a[1]) for a in kwargs.items())
-        return msg, {}
+        if self._running is None:
+            return
+        self.queue = _SimpleQueue()
+        self.handler.queue = self.queue
+        self.start(self.handlers)
+
+log_writer = LogWriter()
 
 def configure_logging(args: argparse.Namespace) -> None:
     logger = logging.getLogger()
     handler = logging.FileHandler(
-        filename=args.logfile, 
-        encoding='utf-8', 
+        filename=args.logfile,
+        encoding='utf-8',
         mode='w',
     )
     loglevel = args.loglevel.upper()
@@ -35,8 +202,9 @@ def configure_logging(args: argparse.Namespace) -> None:
         logger.setLevel(logging.ERROR)
     elif loglevel == 'CRITICAL':
         logger.setLevel(logging.CRITICAL)
-        
+
     #handler.setLevel(logging.INFO)
     handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-    logger.addHandler(handler) 
-    
\ No newline at end of file
+    log_writer.stop()
+    log_writer.start([handler])
+    logger.addHandler(log_writer.handler)
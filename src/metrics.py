@@ -0,0 +1,183 @@
+import bisect
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits to the 60s covalent timeout
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(names, values)]
+    labels.extend(label for label in extra if label)
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(labels) + '}'
+
+class _Metric():
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self, extra: str = '') -> List[str]:
+        """The lines of the metric, with the ``extra`` label added to every sample"""
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, extra: str = '') -> List[str]:
+        lines = self._header()
+        for labels, value in self.values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels, extra)} {value}')
+        return lines
+
+class Gauge(Counter):
+    """A value that goes up and down, or that is read from ``function`` when rendered"""
+    kind = 'gauge'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            function: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def render(self, extra: str = '') -> List[str]:
+        if self.function is not None:
+            self.values[()] = self.function()
+        return super().render(extra)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # per labels: the count of each bucket (not cumulative, last one is +Inf) and the sum
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self.values[labels] = series
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self, extra: str = '') -> List[str]:
+        lines = self._header()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, extra, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            label_str = _format_labels(self.labelnames, labels, extra)
+            lines.append(f'{self.name}_sum{label_str} {total[0]}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+class Registry():
+    """The metrics of this process
+
+    Each prefork worker keeps its own, and a scrape reaches any one of them,
+    so workers label their samples with ``worker``, their pid. Sum over it
+    to get the totals of the server.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[_Metric] = []
+        self.worker: Optional[str] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format"""
+        lines = []
+        extra = '' if self.worker is None else f'worker="{self.worker}"'
+        for metric in self.metrics:
+            lines.extend(metric.render(extra))
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'api_requests_total', 'Requests served by resource, method and status', ['resource', 'method', 'status'],
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    'api_request_duration_seconds', 'Time to build the response by resource', ['resource'],
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'api_requests_in_flight', 'Requests, each in its own greenlet, being processed',
+))
+COVALENT_REQUESTS = registry.register(Counter(
+    'covalent_requests_total', 'Covalent queries by module, chain and outcome', ['module', 'chain', 'status'],
+))
+COVALENT_LATENCY = registry.register(Histogram(
+    'covalent_request_duration_seconds', 'Covalent query latency by module and chain', ['module', 'chain'],
+))
+CACHE_REQUESTS = registry.register(Counter(
+    'cache_requests_total', 'Response cache lookups by resource and result', ['resource', 'result'],
+))
+CACHE_EVICTIONS = registry.register(Counter(
+    'cache_evictions_total', 'Entries evicted from the memory cache to stay under its size',
+))
+CACHE_SIZE = registry.register(Gauge(
+    'cache_size_bytes', 'Size of the values held in the memory cache',
+))
+DB_QUERY_LATENCY = registry.register(Histogram(
+    'db_query_duration_seconds', 'Database statement latency by statement type', ['statement'],
+))
+CACHE_WARMER_REFRESHES = registry.register(Counter(
+    'cache_warmer_refreshes_total', 'Cache entries refreshed by the warmer by resource and outcome', ['resource', 'status'],
+))
+CACHE_WARMER_HITS = registry.register(Counter(
+    'cache_warmer_hits_total', 'Cache hits served from an entry the warmer refreshed, by resource', ['resource'],
+))
+UPSTREAM_IN_FLIGHT = registry.register(Gauge(
+    'upstream_requests_in_flight', 'Covalent queries running by chain and module', ['chain', 'module'],
+))
+UPSTREAM_QUEUE_DEPTH = registry.register(Gauge(
+    'upstream_queue_depth', 'Covalent queries waiting for a slot by chain and module', ['chain', 'module'],
+))
+UPSTREAM_SHED = registry.register(Counter(
+    'upstream_shed_total', 'Covalent queries not admitted by chain, module and reason', ['chain', 'module', 'reason'],
+))
+TRACES_DROPPED = registry.register(Counter(
+    'traces_dropped_total', 'Traces not exported to the collector by reason', ['reason'],
+))
+STALE_RESPONSES = registry.register(Counter(
+    'cache_stale_responses_total', 'Expired cache entries served because upstream was overloaded, by resource', ['resource'],
+))
@@ -2,10 +2,24 @@ import logging
 import os
 import signal
 
+import gevent
+
+from typing import Any, Dict, Optional
+
+from src.api.app import create_app
+from src.api.cache import configure_cache
+from src.api.profiling import profiler
+from src.api.submissions import submission_worker
+from src.api.warmer import warmer
+from src.api.rest import set_json_encoder
 from src.api.server import APIServer, RestAPI
 from src.args import app_args
-from src.logging import LogsAdapter
+from src.externalApis.admission import admission
+from src.logging import LogsAdapter, log_writer
+from src.tracing import exporter
 from src.api_functions import Api_functions
+from src.database.Model import init_database
+from src.database.vault_index import vault_index
 
 logger = logging.getLogger(__name__)
 log = LogsAdapter(logger)
@@ -15,8 +29,10 @@ class No_covalent_key(Exception):
         return "No gived covalent key on env/args"
 
 class Server():
-    def __init__(self) -> None:
+    def __init__(self, config: Optional[Dict[str, Any]] = None) -> None:
         """Initializes the backend server
+
+        config overrides the settings of the flask app, like its database
         May raise:
         - SystemPermissionError due to the given args containing a datadir
         that does not have the correct permissions
@@ -28,6 +44,10 @@ class Server():
             ),
         )
         self.args = arg_parser.parse_args()
+        if self.args.blocking_io and self.args.workers > 1:
+            # a blocked hub stops the heartbeats, a query slower than the
+            # heartbeat timeout would get its worker killed mid-request
+            arg_parser.error('--blocking-io can only run with a single worker')
         
         covalent_key = os.environ.get('COVALENT_KEY', "")
         if (self.args.covalent_key != ""):
@@ -36,21 +56,40 @@ class Server():
         if (covalent_key == "" and self.args.covalent_key == ""):
             raise No_covalent_key()
         
+        set_json_encoder(self.args.json_encoder)
         
         self.api_functions = Api_functions(self.args)
         self.api_server = APIServer(
             rest_api=RestAPI(api_functions=self.api_functions),
+            flask_app=create_app(config),
         )
+        configure_cache(self.api_server.flask_app, self.args)
+        warmer.configure(self.api_server.flask_app, self.args)
+        admission.configure(self.args)
+        init_database(self.api_server.flask_app)
+        vault_index.load(self.api_server.flask_app)
+        submission_worker.configure(self.api_server.flask_app, self.api_functions, self.args)
+        profiler.configure(self.args)
+        exporter.configure(self.args.trace_export)
         
     def shutdown(self) -> None:
         log.debug('Shutdown initiated')
         self.api_server.stop()
+
+    def _set_signal_handlers(self) -> None:
+        gevent.signal_handler(signal.SIGINT, self.shutdown)
+        gevent.signal_handler(signal.SIGTERM, self.shutdown)
+        gevent.signal_handler(signal.SIGHUP, self.api_server.reload)
     
     def main(self) -> None:
+        self._set_signal_handlers()
         self.api_server.start(
             host=self.args.api_host,
             port=self.args.rest_api_port,
+            workers=self.args.workers,
         )
+        exporter.stop()
+        log_writer.stop()
         
     def run_local(self) -> None:
         self.api_server.run(
@@ -59,4 +98,7 @@ class Server():
         )    
         
     def run_heroku(self) -> None:
-        self.api_server.run_heroku()
+        self._set_signal_handlers()
+        self.api_server.run_heroku(workers=self.args.workers)
+        exporter.stop()
+        log_writer.stop()
@@ -0,0 +1,294 @@
+import collections
+import contextlib
+import json
+import logging
+import os
+import time
+
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import gevent
+import gevent.event
+import requests
+
+from src.cooperative import is_cooperative
+from src.logging import LogWriter, LogsAdapter
+from src.metrics import TRACES_DROPPED
+
+logger = logging.getLogger(__name__)
+log = LogsAdapter(logger)
+
+SERVICE_NAME = 'api-fractional-nft'
+# Traces waiting to be sent to a collector, above which new ones are dropped
+COLLECTOR_QUEUE_SIZE = 2000
+# Most traces in one post to the collector
+COLLECTOR_BATCH_SIZE = 200
+# Seconds between posts while there are fewer traces than a batch
+COLLECTOR_FLUSH_INTERVAL = 2
+COLLECTOR_TIMEOUT = 5
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+class Span():
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'attributes')
+
+    def __init__(
+            self,
+            trace: 'Trace',
+            name: str,
+            parent_id: Optional[str],
+            kind: int,
+            attributes: Dict[str, Any],
+    ) -> None:
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end: Optional[int] = None
+        self.attributes = attributes
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.time_ns()
+
+    def duration_ms(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or self.start),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+        }
+        if self.parent_id is not None:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+class Trace():
+    """The spans of one request. Shared by the greenlets and threads working on it"""
+
+    def __init__(self, request_id: Optional[str] = None) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.request_id = request_id or self.trace_id
+        self.spans: List[Span] = []
+        self.finished = False
+
+    def server_timing(self, root: Span) -> str:
+        """Server-Timing header value: the total, then the time of each span name summed up"""
+        durations: Dict[str, float] = {}
+        for span in self.spans:
+            if span is not root:
+                durations[span.name] = durations.get(span.name, 0.0) + span.duration_ms()
+        metrics = [f'total;dur={root.duration_ms():.1f}']
+        metrics.extend(f'{name};dur={duration:.1f}' for name, duration in durations.items())
+        return ', '.join(metrics)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return otlp_request([span.to_otlp() for span in self.spans])
+
+def otlp_request(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """An OTLP/JSON ExportTraceServiceRequest with the given spans, of one or more traces"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': spans,
+        }],
+    }]}
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Optional[Span]:
+    """Start a span in the current trace, None if there is no trace
+
+    The caller must finish() it, and it does not become the parent of spans
+    started after it. Use ``span`` for the usual nested case.
+    """
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return None
+    parent = _current_span.get()
+    new_span = Span(
+        trace=trace,
+        name=name,
+        parent_id=parent.span_id if parent is not None else None,
+        kind=kind,
+        attributes=attributes,
+    )
+    trace.spans.append(new_span)
+    return new_span
+
+@contextlib.contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the block as a span, child of the current one. Does nothing outside a trace"""
+    new_span = start_span(name, kind, **attributes)
+    if new_span is None:
+        yield None
+        return
+
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.finish()
+        _current_span.reset(token)
+
+def start_trace(name: str, request_id: Optional[str] = None, **attributes: Any) -> Span:
+    """Start the trace of a request in the current context and return its root span"""
+    trace = Trace(request_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    root = start_span(name, SPAN_KIND_SERVER, **attributes)
+    _current_span.set(root)
+    return root  # type: ignore  # there is a trace, so there is a span
+
+def finish_trace(root: Span) -> None:
+    trace = root.trace
+    root.finish()
+    trace.finished = True
+    _current_trace.set(None)
+    _current_span.set(None)
+    exporter.export(trace)
+
+class _OtlpLine():
+    """A trace in OTLP/JSON, only serialized when the writer thread writes it"""
+    __slots__ = ('otlp',)
+
+    def __init__(self, otlp: Dict[str, Any]) -> None:
+        self.otlp = otlp
+
+    def __str__(self) -> str:
+        return json.dumps(self.otlp)
+
+class TraceExporter():
+    """Exports finished traces as OTLP/JSON
+
+    To a file, one ExportTraceServiceRequest per line, or to the OTLP/HTTP
+    endpoint of a collector (a url like http://localhost:4318/v1/traces). The
+    request does not wait on either. The file is written by a LogWriter
+    thread of its own, like the logs. For a collector, traces wait in a
+    bounded queue that one sender greenlet posts in batches; when the
+    collector can't keep up the queue fills and new traces are dropped.
+    """
+
+    def __init__(self) -> None:
+        self.destination: Optional[str] = None
+        self.writer = LogWriter()
+        self.file_logger = logging.getLogger(f'{__name__}.export')
+        self.file_logger.propagate = False
+        self.file_logger.setLevel(logging.INFO)
+        self.pending: Deque[Trace] = collections.deque()
+        self._wakeup = gevent.event.Event()
+        self._pid: Optional[int] = None
+
+    @property
+    def to_collector(self) -> bool:
+        return self.destination is not None and self.destination.startswith(('http://', 'https://'))
+
+    def configure(self, destination: Optional[str]) -> None:
+        self.stop()
+        self.destination = destination
+        if destination is None:
+            return
+        if not self.to_collector:
+            try:
+                handler = logging.FileHandler(destination, mode='a', encoding='utf-8')
+            except OSError as e:
+                log.warning('Could not open the trace export file', destination=destination, error=str(e))
+                self.destination = None
+                return
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.writer.start([handler])
+            self.file_logger.handlers = [self.writer.handler]
+        log.info('Exporting traces', destination=destination)
+
+    def export(self, trace: Trace) -> None:
+        if self.destination is None:
+            return
+
+        if not self.to_collector:
+            self.file_logger.info(_OtlpLine(trace.to_otlp()))
+            return
+        if len(self.pending) >= COLLECTOR_QUEUE_SIZE:
+            TRACES_DROPPED.inc('queue_full')
+            return
+        self.pending.append(trace)
+        self._ensure_sending()
+        if len(self.pending) >= COLLECTOR_BATCH_SIZE:
+            self._wakeup.set()
+
+    def _ensure_sending(self) -> None:
+        # each prefork worker sends its own traces
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._wakeup = gevent.event.Event()
+            gevent.spawn(self._send_forever)
+
+    def _send_forever(self) -> None:
+        while True:
+            self._wakeup.wait(COLLECTOR_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            while len(self.pending) != 0:
+                self._send_batch()
+
+    def _send_batch(self) -> None:
+        batch = [self.pending.popleft() for _ in range(min(COLLECTOR_BATCH_SIZE, len(self.pending)))]
+        data = json.dumps(otlp_request([span.to_otlp() for trace in batch for span in trace.spans]))
+        if is_cooperative():
+            sent = self._post(data)
+        else:
+            # a blocking post would stop the hub, and every request with it
+            sent = gevent.get_hub().threadpool.apply(self._post, (data,))
+        if not sent:
+            TRACES_DROPPED.inc('error', amount=len(batch))
+
+    def after_fork(self) -> None:
+        self.writer.after_fork()
+        # the traces of the parent are sent by the parent
+        self.pending = collections.deque()
+
+    def stop(self) -> None:
+        """Write the traces still queued for the file, send the ones for the collector"""
+        self.writer.stop()
+        while len(self.pending) != 0:
+            self._send_batch()
+
+    def _post(self, data: str) -> bool:
+        try:
+            response = requests.post(
+                self.destination,  # type: ignore  # checked in export
+                data=data,
+                headers={'Content-Type': 'application/json'},
+                timeout=COLLECTOR_TIMEOUT,
+            )
+        except requests.exceptions.RequestException as e:
+            log.warning('Could not export traces', destination=self.destination, error=str(e))
+            return False
+        if response.status_code >= 300:
+            log.warning('Could not export traces', destination=self.destination, status_code=response.status_code)
+            return False
+        return True
+
+exporter = TraceExporter()
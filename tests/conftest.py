@@ -0,0 +1,91 @@
+import json
+import logging
+
+from typing import Any, Dict, List
+
+import pytest
+import requests
+
+from src.api.app import create_app, db
+from src.api.cache import configure_cache
+from src.api.rest import RestAPI
+from src.api.server import APIServer
+from src.api.submissions import submission_worker
+from src.api.warmer import warmer
+from src.api_functions import Api_functions
+from src.args import app_args
+from src.database.vault_index import vault_index
+from src.externalApis.admission import admission
+from src.logging import log_writer
+
+NFT_CONTRACT = '0x' + '11' * 20
+
+class FakeCovalent():
+    """Answers the Covalent queries in place of requests, recording their urls"""
+
+    def __init__(self) -> None:
+        self.urls: List[str] = []
+
+    def queries(self, module: str) -> List[str]:
+        return [url for url in self.urls if f'/{module}/' in url]
+
+    def get(self, url: str, **_kwargs: Any) -> requests.Response:
+        self.urls.append(url)
+        if '/balances_v2/' in url:
+            data: Dict[str, Any] = {'items': [{
+                'balance': '1',
+                'contract_address': NFT_CONTRACT,
+                'contract_name': 'Collection',
+                'contract_ticker_symbol': 'NFT',
+                'nft_data': [{'token_id': str(len(self.urls)), 'token_url': 'https://metadata.example.com/1'}],
+            }]}
+        else:
+            # the factory transaction that created the vault
+            data = {'items': [{'tx_hash': '0x' + '22' * 32}]}
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'data': data}).encode()  # pylint: disable=protected-access
+        return response
+
+@pytest.fixture(name='covalent')
+def fixture_covalent(monkeypatch):
+    fake = FakeCovalent()
+    # set on the class, a bound method of the fake gets no session
+    monkeypatch.setattr(requests.Session, 'get', fake.get)
+    return fake
+
+@pytest.fixture(name='app_args')
+def fixture_app_args(tmp_path):
+    return app_args('test', 'test').parse_args([
+        '--covalent-key', 'key',
+        '--logfile', str(tmp_path / 'api.log'),
+        # submissions stay pending, nothing verifies them in the background
+        '--vault-workers', '0',
+    ])
+
+@pytest.fixture(name='api_functions')
+def fixture_api_functions(app_args):
+    api_functions = Api_functions(app_args)
+    yield api_functions
+    logging.getLogger().removeHandler(log_writer.handler)
+    log_writer.stop()
+
+@pytest.fixture(name='app')
+def fixture_app(tmp_path, app_args, api_functions, covalent):  # pylint: disable=unused-argument
+    """The app of a server on an empty database, configured like Server does"""
+    flask_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "database.db"}'})
+    api_server = APIServer(rest_api=RestAPI(api_functions), flask_app=flask_app)
+    configure_cache(flask_app, app_args)
+    warmer.configure(flask_app, app_args)
+    admission.configure(app_args)
+    with flask_app.app_context():
+        db.create_all()
+    vault_index.chains.clear()
+    vault_index.load(flask_app)
+    submission_worker.configure(flask_app, api_functions, app_args)
+    return api_server.flask_app
+
+@pytest.fixture(name='client')
+def fixture_client(app):
+    with app.test_client() as client:
+        yield client
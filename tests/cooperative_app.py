@@ -0,0 +1,86 @@
+"""Serves getNftsUser requests in cooperative mode against a given upstream url
+
+Run by test_cooperative in a fresh interpreter, since the monkey patching
+has to happen before anything else is imported:
+
+    python -m tests.cooperative_app UPSTREAM_URL DB_PATH LOGFILE REQUESTS
+
+Prints a JSON object with the status codes, the elapsed time and what the
+database calls saw.
+"""
+# Must run before anything else imports socket, ssl or threading
+from src.cooperative import patch_all
+patch_all([])
+
+import json
+import sys
+import time
+
+import gevent
+from gevent.monkey import get_original
+
+from src.api.app import create_app, db
+from src.api.cache import configure_cache
+from src.api.rest import RestAPI
+from src.api.server import APIServer
+from src.api.warmer import warmer
+from src.api_functions import Api_functions
+from src.args import app_args
+from src.cooperative import is_cooperative
+from src.database import Model
+from src.database.Model import Vault, db_query_filter
+from src.externalApis import covalent
+from src.externalApis.admission import admission
+from src.logging import log_writer
+
+_get_native_ident = get_original('_thread', 'get_ident')
+
+def main(upstream_url: str, db_path: str, logfile: str, requests_num: int) -> None:
+    covalent.COVALENT_API_URL = upstream_url
+    args = app_args('test', 'test').parse_args(['--covalent-key', 'key', '--logfile', logfile])
+    flask_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    api_server = APIServer(rest_api=RestAPI(Api_functions(args)), flask_app=flask_app)
+    configure_cache(api_server.flask_app, args)
+    warmer.configure(api_server.flask_app, args)
+    admission.configure(args)
+    with flask_app.app_context():
+        db.create_all()
+
+    db_threads = []
+    query_filter = Model._db_query_filter
+
+    def recording_query_filter(*query_args):  # type: ignore
+        db_threads.append(_get_native_ident())
+        return query_filter(*query_args)
+    Model._db_query_filter = recording_query_filter
+
+    def get_nfts(address: str) -> int:
+        with flask_app.test_client() as client:
+            return client.get(f'/v1/43114/getNftsUser/{address}').status_code
+
+    def query_db() -> int:
+        with flask_app.app_context():
+            return len(db_query_filter(Vault, Vault.chainId == 43114))
+
+    # the first request imports and sets up what the timed ones use
+    with flask_app.test_client() as client:
+        assert client.get('/v1/43114/getNftsUser/invalid').status_code == 400
+
+    start = time.monotonic()
+    greenlets = [gevent.spawn(get_nfts, '0x%040x' % i) for i in range(1, requests_num + 1)]
+    db_greenlet = gevent.spawn(query_db)
+    gevent.joinall(greenlets + [db_greenlet], raise_error=True)
+    elapsed = time.monotonic() - start
+    log_writer.stop()
+
+    json.dump({
+        'cooperative': is_cooperative(),
+        'statuses': [greenlet.value for greenlet in greenlets],
+        'elapsed': elapsed,
+        'vaults': db_greenlet.value,
+        'main_thread': _get_native_ident(),
+        'db_threads': db_threads,
+    }, sys.stdout)
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]))
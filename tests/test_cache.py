@@ -0,0 +1,103 @@
+from typing import Any, Dict
+
+from src.api.cache import CACHE_TIMEOUTS
+from src.api.v1.encoding import checksum_address
+from src.database.vault_index import vault_index
+from src.externalApis.admission import admission
+
+VAULT = checksum_address('0x' + 'ab' * 20)
+USER = '0x' + 'cd' * 20
+
+def _vault(address: str) -> Dict[str, Any]:
+    return {
+        'name': 'Vault',
+        'symbol': 'VLT',
+        'supply': '1000',
+        'price': '1',
+        'fee': '2',
+        'contract_address': address,
+        'curator_address': checksum_address('0x' + 'ef' * 20),
+        'nfts': [],
+    }
+
+def test_vault_insert_invalidates_vault_and_vaults(app, client, api_functions):
+    """After an insert, the ETags of the /vault and /vaults responses before it no longer match"""
+    vault_before = client.get(f'/v1/43114/vault?address={VAULT}')
+    vaults_before = client.get('/v1/43114/vaults')
+    assert vault_before.json['result']['vault'] == {}
+    assert vaults_before.json['result']['pagination']['total'] == 0
+
+    with app.app_context():
+        assert api_functions.insertVault(_vault(VAULT), '43114') == (True, 'Created')
+
+    vault_after = client.get(f'/v1/43114/vault?address={VAULT}', headers={'If-None-Match': vault_before.headers['ETag']})
+    vaults_after = client.get('/v1/43114/vaults', headers={'If-None-Match': vaults_before.headers['ETag']})
+    assert vault_after.status_code == 200
+    assert vault_after.json['result']['vault']['contract_address'] == VAULT
+    assert vaults_after.status_code == 200
+    assert [vault['contract_address'] for vault in vaults_after.json['result']['vaults']] == [VAULT]
+
+def test_vaults_keep_insertion_order(app, client, api_functions):
+    """/vaults pages list the vaults in the order they were inserted, before and after a reload"""
+    # digits only, so no checksum casing can make address order match this one
+    addresses = [checksum_address('0x' + byte * 20) for byte in ('33', '11', '22')]
+    with app.app_context():
+        for address in addresses:
+            api_functions.insertVault(_vault(address), '43114')
+    inserted = client.get('/v1/43114/vaults?perpage=2&page=1').json['result']['vaults']
+    inserted += client.get('/v1/43114/vaults?perpage=2&page=2').json['result']['vaults']
+    assert [vault['contract_address'] for vault in inserted] == addresses
+
+    vault_index.chains.clear()
+    reloaded = client.get('/v1/43114/vaults?perpage=3&page=1').json['result']['vaults']
+    assert [vault['contract_address'] for vault in reloaded] == addresses
+
+def test_address_case_and_location_share_one_entry(client, covalent):
+    """Lowercase, uppercase and checksummed addresses, in the path or the query string, are one entry"""
+    responses = [
+        client.get(f'/v1/43114/getNftsUser/{USER.lower()}'),
+        client.get(f'/v1/43114/getNftsUser/0x{USER[2:].upper()}'),
+        client.get(f'/v1/getNftsUser?address={checksum_address(USER)}&chainID=43114'),
+        client.get(f'/v1/getNftsUser?chainID=43114&address={USER.lower()}'),
+    ]
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.headers['ETag'] for response in responses}) == 1
+    assert len(covalent.queries('balances_v2')) == 1
+
+def test_if_none_match_returns_304_without_covalent(client, covalent):
+    first = client.get(f'/v1/43114/getNftsUser/{USER}')
+    assert len(covalent.queries('balances_v2')) == 1
+
+    response = client.get(f'/v1/43114/getNftsUser/{USER}', headers={'If-None-Match': first.headers['ETag']})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert len(covalent.queries('balances_v2')) == 1
+
+def test_saturated_module_returns_503(app_args, client, covalent):
+    app_args.upstream_concurrency = 1
+    app_args.upstream_queue = 0
+    admission.configure(app_args)
+
+    # the only slot is taken and nothing may wait for it
+    with admission.admit('43114', 'balances_v2'):
+        response = client.get(f'/v1/43114/getNftsUser/{USER}')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(admission.retry_after)
+    assert covalent.queries('balances_v2') == []
+
+def test_saturated_module_serves_stale_entry(monkeypatch, app_args, client, covalent):
+    monkeypatch.setitem(CACHE_TIMEOUTS, 'nfts', 0)
+    app_args.upstream_concurrency = 1
+    app_args.upstream_queue = 0
+    admission.configure(app_args)
+    expired = client.get(f'/v1/43114/getNftsUser/{USER}')
+
+    with admission.admit('43114', 'balances_v2'):
+        response = client.get(f'/v1/43114/getNftsUser/{USER}')
+
+    assert response.status_code == 200
+    assert response.get_data() == expired.get_data()
+    assert len(covalent.queries('balances_v2')) == 1
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+UPSTREAM_DELAY = 1
+REQUESTS_NUM = 8
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class _SlowCovalentHandler(BaseHTTPRequestHandler):
+    """Answers every balances_v2 query with one nft, after UPSTREAM_DELAY seconds"""
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        time.sleep(UPSTREAM_DELAY)
+        body = json.dumps({'data': {'items': [{
+            'balance': '1',
+            'contract_address': '0x' + '11' * 20,
+            'contract_name': 'Collection',
+            'contract_ticker_symbol': 'NFT',
+            'nft_data': [{'token_id': '1', 'token_url': 'https://metadata.example.com/1'}],
+        }]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+class _SlowCovalentServer(ThreadingHTTPServer):
+    # the default backlog of 5 would queue some of the concurrent connections
+    request_queue_size = 64
+
+@pytest.fixture(name='upstream_url')
+def fixture_upstream_url():
+    server = _SlowCovalentServer(('127.0.0.1', 0), _SlowCovalentHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/v1'
+    server.shutdown()
+    server.server_close()
+
+def test_slow_upstream_calls_run_concurrently(upstream_url, tmp_path):
+    """With patch_all, N getNftsUser requests waiting on a slow upstream take about as long as one"""
+    process = subprocess.run(
+        [
+            sys.executable, '-m', 'tests.cooperative_app',
+            upstream_url,
+            str(tmp_path / 'database.db'),
+            str(tmp_path / 'api.log'),
+            str(REQUESTS_NUM),
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True,
+    )
+    result = json.loads(process.stdout)
+
+    assert result['cooperative'] is True
+    assert result['statuses'] == [200] * REQUESTS_NUM
+    assert result['elapsed'] < 2 * UPSTREAM_DELAY
+    # the sqlite calls ran in the hub threadpool, not on the hub's thread
+    assert result['vaults'] == 0
+    assert len(result['db_threads']) == 1
+    assert result['db_threads'][0] != result['main_thread']
@@ -0,0 +1,29 @@
+from src.api.v1.encoding import checksum_address
+
+VAULT = {
+    'chainID': '43114',
+    'name': 'Vault',
+    'symbol': 'VLT',
+    'supply': '1000',
+    'price': '1',
+    'fee': '2',
+    'contract_address': '0x' + 'ab' * 20,
+    'curator_address': '0x' + 'ef' * 20,
+    'nfts': [],
+}
+
+def test_duplicate_submission_returns_same_id(client):
+    first = client.post('/v1/43114/vault', json=VAULT)
+    # the same vault, with its address checksummed this time
+    second = client.post('/v1/43114/vault', json={**VAULT, 'contract_address': checksum_address(VAULT['contract_address'])})
+
+    assert first.status_code == 202
+    assert first.json['message'] == 'Accepted'
+    assert second.status_code == 202
+    assert second.json['message'] == 'Already submitted'
+    assert second.json['result']['id'] == first.json['result']['id']
+    assert second.headers['Location'] == first.headers['Location']
+
+    submission = client.get(first.headers['Location'])
+    assert submission.status_code == 200
+    assert submission.json['result']['status'] == 'pending'